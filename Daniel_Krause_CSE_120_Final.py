@@ -1,29 +1,109 @@
-import pygame
-from datetime import datetime
+import argparse
+import atexit
+import cProfile
+import heapq
+import json
+import logging
+import logging.handlers
+import math
+import os
+import queue
 import random
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+
+# PyGame is only needed by the Engine, and importing it takes a good part of a second. It is imported
+#   by load_pygame() when the first Engine is made, so Board and the headless tools never load it
+pygame = None
+
+# Import PyGame if it has not been imported yet. Returns the module, or None if it is not installed
+def load_pygame():
+    global pygame
+    if pygame is None:
+        try:
+            import pygame as module
+        except ImportError:
+            return None
+        pygame = module
+    return pygame
+
+# NumPy is optional, and importing it also takes a good part of the startup time. It is imported by
+#   load_numpy() the first time a big map or an analysis tool can use it
+numpy = None
+numpy_tried = False
+
+# Import NumPy if it has not been imported yet. Returns the module, or None if it is not installed
+def load_numpy():
+    global numpy, numpy_tried
+    if not numpy_tried:
+        numpy_tried = True
+        try:
+            import numpy as module
+        except ImportError:
+            return None
+        numpy = module
+    return numpy
 
 """
-    Debug Settings
+    Logging
 
-    For testing. Set enable_log to true to have the engine log its actions during each frame
+    Everything logs through the "maze_runner" logger. Messages use %-style arguments, so nothing is
+        formatted unless the message passes the level filter. configure_logging() sets the level
+        for the run and hands records to a background thread through a queue, so writing to the
+        terminal ( or the optional JSON lines file ) never holds up the game loop
 """
-# Set this global variable to true to enable log messages. Set to false to disable logging
-enable_log = True
+logger = logging.getLogger( "maze_runner" )
 
-# Get the current date and time formatted as <Month Day, Year @ Hour:Min:Sec>
-def get_date_and_time():
-    return f"{datetime.now().strftime('%b %d, %Y @ %H:%M:%S')}"
+# Console format: <Month Day, Year @ Hour:Min:Sec> followed by the message, colored by level
+class ColorFormatter( logging.Formatter ):
+    colors = { logging.DEBUG: "\x1b[32m", logging.INFO: "\x1b[32m", logging.WARNING: "\x1b[33m" }
 
-# Log a message to the console
-# message is a string that you want to log
-# level selects the color of the log text: 0->Green, 1->Yellow, 2->Red
-def log(message, level):
-    if level == 0:
-        print(f"<{get_date_and_time()}>\x1b[32m [LEVEL - 0] {message}\x1b[0m")
-    elif level == 1:
-        print( f"<{get_date_and_time()}>\x1b[33m [LEVEL - 1] {message}\x1b[0m" )
-    else:
-        print(f"<{get_date_and_time()}>\x1b[31m [LEVEL - {level}] {message}\x1b[0m")
+    def __init__(self):
+        super().__init__( datefmt="%b %d, %Y @ %H:%M:%S" )
+
+    def format( self, record ):
+        color = self.colors.get( record.levelno, "\x1b[31m" )
+        return f"<{self.formatTime( record, self.datefmt )}>{color} [{record.levelname}] {record.getMessage()}\x1b[0m"
+
+# One JSON object per line
+class JsonLinesFormatter( logging.Formatter ):
+    def format( self, record ):
+        return json.dumps( {
+            "time": record.created,
+            "level": record.levelname,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        } )
+
+# Hands records to the queue untouched, so formatting happens on the listener thread
+# Safe here because every message argument is an immutable number or string
+class DeferredQueueHandler( logging.handlers.QueueHandler ):
+    def prepare( self, record ):
+        return record
+
+# Send log messages at level and above to the terminal, and to json_path as JSON lines if given
+# Returns the QueueListener doing the writing. It is stopped automatically when the program exits
+def configure_logging( level="INFO", json_path=None ):
+    handlers = [ logging.StreamHandler() ]
+    handlers[0].setFormatter( ColorFormatter() )
+    if json_path is not None:
+        handlers.append( logging.FileHandler( json_path, mode="a", encoding="utf-8" ) )
+        handlers[1].setFormatter( JsonLinesFormatter() )
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener( records, *handlers )
+    listener.start()
+    atexit.register( listener.stop )
+
+    for handler in list( logger.handlers ):
+        logger.removeHandler( handler )
+    logger.addHandler( DeferredQueueHandler( records ) )
+    logger.setLevel( level )
+    logger.propagate = False
+    return listener
 
 """
     Object Class
@@ -46,8 +126,7 @@ class Player(GameObject):
     def __init__(self, ix, iy):
         super().__init__(ix, iy)
         self.color = (   0,   0, 255 )
-        if enable_log:
-            log(f"Player initialized at [ {self.x}, {self.y} ]", 0)
+        logger.debug( "Player initialized at [ %d, %d ]", self.x, self.y )
 
 """
     Key Class - Extends GameObject
@@ -58,8 +137,7 @@ class Key(GameObject):
     # ix and iy are the initial player x and y location in the board
     def __init__(self, ix, iy):
         super().__init__(ix, iy)
-        if enable_log:
-            log(f"Key initialized at [ {self.x}, {self.y} ]", 0)
+        logger.debug( "Key initialized at [ %d, %d ]", self.x, self.y )
 
 """
     Door Class - Extends GameObject
@@ -71,8 +149,7 @@ class Door(GameObject):
     def __init__(self, ix, iy):
         super().__init__(ix, iy)
         self.locked = True
-        if enable_log:
-            log(f"Key initialized at [ {self.x}, {self.y} ]", 0)
+        logger.debug( "Key initialized at [ %d, %d ]", self.x, self.y )
 
 """
     Room
@@ -87,6 +164,531 @@ class Room:
         self.h = ih
         self.cx = ix + int(iw / 2)
         self.cy = iy + int(ih / 2)
+        # Index of the room in Board.rooms, set by Board.place_room
+        self.id = None
+
+"""
+    Tile Codes
+
+    Every map tile is stored as a small integer code. TILE_NAMES maps a code back to the name used
+        by Board.colors, and TILE_CODES maps a name to its code
+"""
+TILE_WALL     = 0
+TILE_FLOOR    = 1
+TILE_KEY      = 2
+TILE_LOCKED   = 3
+TILE_UNLOCKED = 4
+TILE_NAMES = [ "WALL", "FLOOR", "KEY", "LOCKED", "UNLOCKED" ]
+TILE_CODES = { name: code for code, name in enumerate( TILE_NAMES ) }
+
+"""
+    Tile Column
+
+    A view of one column of a TileGrid. Lets the old board[x][y] syntax keep working:
+        reading returns the tile name, writing accepts either a name or a code
+"""
+class TileColumn:
+    def __init__(self, igrid, ix):
+        self.grid = igrid
+        self.offset = ix * igrid.height
+
+    def __len__(self):
+        return self.grid.height
+
+    # Negative y counts from the end like a list. Anything outside the column raises IndexError
+    #   instead of reading into the next column of the flat buffer
+    def index(self, y):
+        height = self.grid.height
+        if y < 0:
+            y += height
+        if not 0 <= y < height:
+            raise IndexError( "tile row out of range" )
+        return self.offset + y
+
+    # A slice returns a list of tile names, like slicing the old list column did
+    def __getitem__(self, y):
+        if isinstance( y, slice ):
+            cells = self.grid.cells
+            return [ TILE_NAMES[ cells[ self.offset + i ] ] for i in range( *y.indices( self.grid.height ) ) ]
+        return TILE_NAMES[ self.grid.cells[ self.index( y ) ] ]
+
+    def __setitem__(self, y, tile):
+        if isinstance( tile, str ):
+            tile = TILE_CODES[ tile ]
+        self.grid.cells[ self.index( y ) ] = tile
+
+"""
+    Tile Grid
+
+    This class stores the map as one contiguous bytearray of tile codes. Tiles are stored column
+        by column ( index = x * height + y ) to match the board[x][y] indexing used everywhere else.
+        Whole-map and rectangle fills are done with slice assignment instead of per-tile loops.
+        The grid can also be laid over an existing writable buffer ( such as shared memory ), in
+        which case the buffer is used as is and ifill is ignored
+"""
+class TileGrid:
+    # Grids with at least this many tiles are filled and copied through NumPy when it is installed.
+    #   Smaller grids are faster with plain slices than with loading NumPy
+    numpy_min_tiles = 1 << 16
+
+    def __init__(self, iwidth, iheight=None, ifill=TILE_WALL, ibuffer=None):
+        self.width = iwidth
+        self.height = iwidth if iheight is None else iheight
+        if ibuffer is None:
+            self.cells = bytearray( [ ifill ] ) * ( self.width * self.height )
+        else:
+            self.cells = memoryview( ibuffer ).cast( "B" )[ : self.width * self.height ]
+        # Cached runs of each tile code, see strip()
+        self.strips = {}
+        # NumPy view of the cells, made the first time it is asked for. See array
+        self.view = None
+
+    # Zero-copy ( width, height ) NumPy view of the cells, or None if NumPy is not installed
+    @property
+    def array(self):
+        if self.view is None and load_numpy() is not None:
+            self.view = numpy.frombuffer( self.cells, dtype=numpy.uint8 ).reshape( self.width, self.height )
+        return self.view
+
+    # The array view if the grid is big enough for NumPy to pay off, otherwise None
+    def large_array(self):
+        if len( self.cells ) < self.numpy_min_tiles:
+            return None
+        return self.array
+
+    def __len__(self):
+        return self.width
+
+    # board[x] returns a column view so board[x][y] keeps working
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.width
+        if not 0 <= x < self.width:
+            raise IndexError( "tile column out of range" )
+        return TileColumn( self, x )
+
+    def get(self, x, y):
+        return self.cells[ x * self.height + y ]
+
+    def set(self, x, y, code):
+        self.cells[ x * self.height + y ] = code
+
+    # Set every tile in the grid to code
+    def fill(self, code):
+        self.cells[:] = bytes( [ code ] ) * len( self.cells )
+
+    # Return a memoryview of length tiles set to code, used as the source for slice fills
+    def strip(self, code, length):
+        strip = self.strips.get( code )
+        if strip is None:
+            strip = memoryview( bytes( [ code ] ) * max( self.width, self.height ) )
+            self.strips[ code ] = strip
+        return strip[ : length ]
+
+    # Set every tile in the w by h rectangle with top left corner [ x, y ] to code
+    def fill_rect(self, x, y, w, h, code):
+        if w <= 0 or h <= 0:
+            return
+        start = x * self.height + y
+        # One column is a single slice, one row is a single extended slice
+        if w == 1:
+            self.cells[ start : start + h ] = self.strip( code, h )
+        elif h == 1:
+            self.cells[ start : start + w * self.height : self.height ] = self.strip( code, w )
+        elif self.large_array() is not None:
+            self.view[ x : x + w, y : y + h ] = code
+        else:
+            strip = self.strip( code, h )
+            for start in range( start, start + w * self.height, self.height ):
+                self.cells[ start : start + h ] = strip
+
+    # Set every tile in each ( x, y, w, h ) rectangle of rects to code
+    # Does the same as calling fill_rect for each rectangle, without the per-call overhead
+    def fill_rects(self, rects, code):
+        array = self.large_array()
+        if array is not None:
+            for x, y, w, h in rects:
+                array[ x : x + w, y : y + h ] = code
+            return
+
+        cells = self.cells
+        height = self.height
+        strip = self.strip( code, max( self.width, height ) )
+        for x, y, w, h in rects:
+            start = x * height + y
+            if h == 1:
+                cells[ start : start + w * height : height ] = strip[ : w ]
+            else:
+                column = strip[ : h ]
+                for start in range( start, start + w * height, height ):
+                    cells[ start : start + h ] = column
+
+"""
+    Room Graph
+
+    Rooms are the nodes and tunnels are the edges, weighted by tunnel length. Board.place_room and
+        Board.connect_rooms fill it in while a level is generated.
+
+    A spatial index splits the map into bucket_size square buckets and lists the rooms that overlap
+        each one, so finding the rooms near a tile only looks at the few buckets around it. The
+        index and the adjacency lists are built the first time they are needed, so generating a
+        level only pays for appending to lists
+"""
+class RoomGraph:
+    def __init__(self, iwidth, irooms, iedges=None, ibucket_size=32):
+        self.width = iwidth
+        self.rooms = irooms
+        self.edges = [] if iedges is None else iedges
+        self.bucket_size = ibucket_size
+        self.buckets_across = ( iwidth + ibucket_size - 1 ) // ibucket_size
+
+        # Built on demand, along with how many rooms and edges they include
+        self.buckets = None
+        self.indexed_rooms = 0
+        self.adjacency = None
+        self.indexed_edges = 0
+
+    def add_edge( self, a, b, length ):
+        self.edges.append( ( a, b, length ) )
+
+    # Bring the spatial index up to date with self.rooms
+    def update_index( self ):
+        if self.buckets is None:
+            self.buckets = [ [] for _ in range( self.buckets_across * self.buckets_across ) ]
+            self.indexed_rooms = 0
+        size = self.bucket_size
+        for room_id in range( self.indexed_rooms, len( self.rooms ) ):
+            room = self.rooms[ room_id ]
+            for bx in range( room.x // size, ( room.x + room.w - 1 ) // size + 1 ):
+                for by in range( room.y // size, ( room.y + room.h - 1 ) // size + 1 ):
+                    self.buckets[ bx * self.buckets_across + by ].append( room_id )
+        self.indexed_rooms = len( self.rooms )
+
+    # Bring the adjacency lists up to date with self.edges
+    def update_adjacency( self ):
+        if self.adjacency is None or len( self.adjacency ) < len( self.rooms ):
+            self.adjacency = [ [] for _ in range( len( self.rooms ) ) ]
+            self.indexed_edges = 0
+        for a, b, length in self.edges[ self.indexed_edges : ]:
+            self.adjacency[ a ].append( ( b, length ) )
+            self.adjacency[ b ].append( ( a, length ) )
+        self.indexed_edges = len( self.edges )
+
+    # Return the ids of the rooms with at least one tile within radius tiles ( in x and y ) of [ x, y ]
+    def rooms_near( self, x, y, radius ):
+        if self.indexed_rooms != len( self.rooms ) or self.buckets is None:
+            self.update_index()
+        size = self.bucket_size
+        last = self.buckets_across - 1
+        found = set()
+        for bx in range( max( ( x - radius ) // size, 0 ), min( ( x + radius ) // size, last ) + 1 ):
+            for by in range( max( ( y - radius ) // size, 0 ), min( ( y + radius ) // size, last ) + 1 ):
+                for room_id in self.buckets[ bx * self.buckets_across + by ]:
+                    room = self.rooms[ room_id ]
+                    if ( room.x - radius <= x < room.x + room.w + radius and
+                         room.y - radius <= y < room.y + room.h + radius ):
+                        found.add( room_id )
+        return sorted( found )
+
+    # Return [ ( neighbor id, tunnel length ), ... ] for room room_id
+    def neighbors( self, room_id ):
+        if self.adjacency is None or self.indexed_edges != len( self.edges ) or len( self.adjacency ) < len( self.rooms ):
+            self.update_adjacency()
+        return self.adjacency[ room_id ]
+
+    # True if every room can be reached from every other room through tunnels
+    def connected( self ):
+        if not self.rooms:
+            return True
+        seen = { 0 }
+        stack = [ 0 ]
+        while stack:
+            for neighbor, _ in self.neighbors( stack.pop() ):
+                if neighbor not in seen:
+                    seen.add( neighbor )
+                    stack.append( neighbor )
+        return len( seen ) == len( self.rooms )
+
+"""
+    Level Generators
+
+    A level generator is any object with a generate( board, rng ) method. generate carves rooms
+        into an already cleared board using board.place_room and board.connect_rooms, then places
+        the player, door, and key. rng is anything with the random module interface
+
+    Both generators take a connect strategy for the tunnels:
+        "chain" -> tunnel every room to the next one in the list, like the original game
+        "mst"   -> tunnel along a minimum spanning tree of nearby rooms, plus extra_loops random
+                   tunnels between nearby rooms that are not in the tree
+"""
+CONNECT_STRATEGIES = ( "chain", "mst" )
+
+def check_connect( connect, extra_loops ):
+    if connect not in CONNECT_STRATEGIES:
+        raise ValueError( f"Unknown connect strategy {connect!r}, expected one of {CONNECT_STRATEGIES}" )
+    if extra_loops < 0:
+        raise ValueError( f"extra_loops must not be negative, got {extra_loops}" )
+
+# Tunnel the rooms together with the given strategy
+def connect_all( board, rng, connect, extra_loops ):
+    rooms = board.rooms
+    if connect == "chain":
+        connect_rooms = board.connect_rooms
+        for r in range( len( rooms ) - 1 ):
+            connect_rooms( rooms[ r ], rooms[ r + 1 ] )
+    else:
+        connect_mst( board, rng, extra_loops )
+
+"""
+    Minimum spanning tree tunnels
+
+    Candidate tunnels only join rooms whose centers are within one spatial index bucket of each
+        other, so the work stays close to linear in the number of rooms. Kruskal's algorithm with
+        a union-find picks the shortest candidates that join separate groups of rooms. Groups
+        that no candidate could join ( rooms far from every other room ) are then chained together
+"""
+def connect_mst( board, rng, extra_loops ):
+    rooms = board.rooms
+    graph = board.graph
+
+    # Candidate edges as ( Manhattan distance between centers, room, room )
+    candidates = []
+    for room in rooms:
+        for other_id in graph.rooms_near( room.cx, room.cy, graph.bucket_size ):
+            if other_id > room.id:
+                other = rooms[ other_id ]
+                candidates.append( ( abs( room.cx - other.cx ) + abs( room.cy - other.cy ), room.id, other_id ) )
+    candidates.sort()
+
+    parent = list( range( len( rooms ) ) )
+    def find( i ):
+        while parent[ i ] != i:
+            parent[ i ] = parent[ parent[ i ] ]
+            i = parent[ i ]
+        return i
+
+    unused = []
+    for candidate in candidates:
+        a = find( candidate[1] )
+        b = find( candidate[2] )
+        if a == b:
+            unused.append( candidate )
+            continue
+        parent[ a ] = b
+        board.connect_rooms( rooms[ candidate[1] ], rooms[ candidate[2] ] )
+
+    # Join any groups that are still apart, in room order
+    last = None
+    for room in rooms:
+        root = find( room.id )
+        if last is not None and root != find( last.id ):
+            parent[ root ] = find( last.id )
+            board.connect_rooms( last, room )
+        last = room
+
+    # Add loops so there is more than one way around the map
+    for _, a, b in rng.sample( unused, min( extra_loops, len( unused ) ) ):
+        board.connect_rooms( rooms[ a ], rooms[ b ] )
+
+# Put the player in the first room, the door in a random middle room, and the key in the last room
+def place_objects( board, rng ):
+    if len( board.rooms ) < 3:
+        raise ValueError( f"A level needs at least 3 rooms, but only {len( board.rooms )} fit on the map" )
+
+    # Put the player in the middle of the first room
+    board.place_player( board.rooms[0].cx, board.rooms[0].cy )
+    # Put the door in the middle of a random room between the first and last
+    rand_room = rng.choice( board.rooms[1:len(board.rooms)-1] )
+    board.place_door( rand_room.cx, rand_room.cy )
+    # Put the key in the middle of the last room
+    board.place_key( board.rooms[-1].cx, board.rooms[-1].cy )
+
+"""
+    Block Generator
+
+    The original level layout. The map is split into a grid of block_size square blocks, each
+        block gets one room of random size in its top left corner, and the rooms are tunneled
+        together in a random order. cols and rows default to as many blocks as fit on the map
+"""
+class BlockGenerator:
+    def __init__(self, icols=None, irows=None, iblock_size=20, imin_room=5, imax_room=19, iconnect="chain", iextra_loops=0):
+        if imax_room > iblock_size - 1:
+            raise ValueError( f"Rooms up to {imax_room} tiles do not fit in {iblock_size} tile blocks" )
+        check_connect( iconnect, iextra_loops )
+        self.connect = iconnect
+        self.extra_loops = iextra_loops
+        self.cols = icols
+        self.rows = irows
+        self.block_size = iblock_size
+        self.min_room = imin_room
+        self.max_room = imax_room
+
+    def generate( self, board, rng ):
+        cols = self.cols
+        if cols is None:
+            cols = ( board.width - 1 ) // self.block_size
+        rows = self.rows
+        if rows is None:
+            rows = ( board.width - 1 ) // self.block_size
+        if cols * self.block_size + 1 > board.width or rows * self.block_size + 1 > board.width:
+            raise ValueError( f"A {cols} by {rows} block layout does not fit on a {board.width} tile map" )
+
+        # Generate rooms in a random order
+        block_loc = [ [ c, r ] for c in range( cols ) for r in range( rows ) ]
+        rng.shuffle( block_loc )
+
+        while block_loc:
+            this_block = block_loc.pop()
+            rw = rng.randint( self.min_room, self.max_room )
+            rh = rng.randint( self.min_room, self.max_room )
+            rx = this_block[0]*self.block_size + 1
+            ry = this_block[1]*self.block_size + 1
+
+            board.place_room(rx, ry, rh, rw)
+
+        connect_all( board, rng, self.connect, self.extra_loops )
+
+        place_objects( board, rng )
+
+"""
+    BSP Generator
+
+    Binary space partitioning. The map is split in two along its longer side again and again
+        until every partition ( leaf ) is small enough to hold one room. room_count caps the number
+        of leaves by always splitting the largest leaf first. Leaves are visited in tree order, so
+        rooms that are next to each other in the list are also near each other on the map, and
+        each tunnel stays inside the partition its two rooms share. The work done is linear in
+        the number of rooms, which in turn is linear in the map area
+"""
+class BSPGenerator:
+    def __init__(self, imin_room=5, imax_room=19, iroom_count=None, ipadding=1, iconnect="chain", iextra_loops=0):
+        if imin_room < 1 or imax_room < imin_room:
+            raise ValueError( f"Invalid room size range {imin_room} -> {imax_room}" )
+        check_connect( iconnect, iextra_loops )
+        self.connect = iconnect
+        self.extra_loops = iextra_loops
+        self.min_room = imin_room
+        self.max_room = imax_room
+        self.room_count = iroom_count
+        self.padding = ipadding
+
+    # Return a random int N such that lo <= N <= hi. Much cheaper than rng.randint on big maps
+    @staticmethod
+    def rand_int( rand, lo, hi ):
+        return lo + int( rand() * ( hi - lo + 1 ) )
+
+    # Pick the axis to split a w by h leaf along. Returns ( split_x, length ), or None if it cannot be split
+    @staticmethod
+    def split_axis( w, h, leaf_min ):
+        # Split along the longer side when both halves can still hold a room, otherwise the shorter
+        for split_x in ( ( True, False ) if w >= h else ( False, True ) ):
+            length = w if split_x else h
+            if length >= 2 * leaf_min:
+                return split_x, length
+        return None
+
+    # Split the map until every leaf fits one room. Leaves are returned in tree order
+    def split_to_size( self, width, rand ):
+        leaf_min = self.min_room + 2 * self.padding
+        leaf_max = self.max_room + 2 * self.padding
+
+        leaves = []
+        stack = [ ( 0, 0, width, width ) ]
+        while stack:
+            x, y, w, h = leaf = stack.pop()
+            axis = None
+            if w > leaf_max or h > leaf_max:
+                axis = self.split_axis( w, h, leaf_min )
+            if axis is None:
+                leaves.append( leaf )
+                continue
+
+            split_x, length = axis
+            cut = self.rand_int( rand, leaf_min, length - leaf_min )
+            # Push the second half first so the first half is visited first
+            if split_x:
+                stack.append( ( x + cut, y, w - cut, h ) )
+                stack.append( ( x, y, cut, h ) )
+            else:
+                stack.append( ( x, y + cut, w, h - cut ) )
+                stack.append( ( x, y, w, cut ) )
+        return leaves
+
+    # Split the largest leaf until there are room_count leaves. Leaves are returned in tree order
+    def split_to_count( self, width, rand ):
+        leaf_min = self.min_room + 2 * self.padding
+
+        # A node is [ x, y, w, h, first child, second child ]
+        root = [ 0, 0, width, width, None, None ]
+        # Entries are ( -area, tie breaker, node )
+        heap = [ ( -width * width, 0, root ) ]
+        leaf_total = 1
+        counter = 1
+        while heap and leaf_total < self.room_count:
+            node = heapq.heappop( heap )[2]
+            x, y, w, h = node[0], node[1], node[2], node[3]
+            axis = self.split_axis( w, h, leaf_min )
+            if axis is None:
+                continue
+
+            split_x, length = axis
+            cut = self.rand_int( rand, leaf_min, length - leaf_min )
+            if split_x:
+                node[4] = [ x, y, cut, h, None, None ]
+                node[5] = [ x + cut, y, w - cut, h, None, None ]
+            else:
+                node[4] = [ x, y, w, cut, None, None ]
+                node[5] = [ x, y + cut, w, h - cut, None, None ]
+            for child in ( node[4], node[5] ):
+                heapq.heappush( heap, ( -child[2] * child[3], counter, child ) )
+                counter += 1
+            leaf_total += 1
+
+        # Walk the tree in order to collect the leaves
+        leaves = []
+        stack = [ root ]
+        while stack:
+            node = stack.pop()
+            if node[4] is None:
+                leaves.append( ( node[0], node[1], node[2], node[3] ) )
+            else:
+                stack.append( node[5] )
+                stack.append( node[4] )
+        return leaves
+
+    def generate( self, board, rng ):
+        self.carve( board, rng )
+        place_objects( board, rng )
+
+    # Carve the rooms and tunnels without placing the player, door, and key
+    def carve( self, board, rng ):
+        if board.width < self.min_room + 2 * self.padding:
+            raise ValueError( f"A {board.width} tile map is too small for {self.min_room} tile rooms" )
+
+        rand = rng.random
+        if self.room_count is None:
+            leaves = self.split_to_size( board.width, rand )
+        else:
+            leaves = self.split_to_count( board.width, rand )
+
+        # Put one room of random size at a random spot inside every leaf
+        # rand_int is inlined here since this loop runs once per room
+        pad = self.padding
+        min_room = self.min_room
+        max_room = self.max_room
+        place_room = board.place_room
+        board.begin_carve()
+        for x, y, w, h in leaves:
+            w -= 2 * pad
+            h -= 2 * pad
+            rw = min_room + int( rand() * ( ( max_room if max_room < w else w ) - min_room + 1 ) )
+            rh = min_room + int( rand() * ( ( max_room if max_room < h else h ) - min_room + 1 ) )
+            rx = x + pad + int( rand() * ( w - rw + 1 ) )
+            ry = y + pad + int( rand() * ( h - rh + 1 ) )
+            place_room( rx, ry, rh, rw )
+
+        connect_all( board, rng, self.connect, self.extra_loops )
+        board.end_carve()
 
 """
     Board Class
@@ -94,7 +696,8 @@ class Room:
     This class defines a game board. The board is a 2D array 
 """
 class Board:
-    def __init__(self, iwidth):
+    # ibuffer is an optional writable buffer to keep the tiles in, see TileGrid
+    def __init__(self, iwidth, igenerator=None, ibuffer=None):
         self.width = iwidth
 
         # define colors
@@ -106,38 +709,48 @@ class Board:
             "UNLOCKED": ( 132, 153,  79 ),     # Open Door
         }
 
-        # Define an empty list for map
-        self.board = []
+        # Look up tile colors by tile code instead of by name
+        self.tile_colors = [ self.colors[ name ] for name in TILE_NAMES ]
+
+        # Define the map as a width by width grid of tile codes
+        self.board = TileGrid( self.width, ibuffer=ibuffer )
 
-        # Define an empty list for rooms
+        # Define an empty list for rooms, and the graph of how they are connected
         self.rooms = []
+        self.graph = RoomGraph( self.width, self.rooms )
 
-        # Make a number of rows equal to the board width
-        for row in range(self.width):
-            r = []
-            # Make a number of cols equal to the board width
-            for col in range(self.width):
-                r.append("")
-            # Add the row to the board
-            self.board.append(r)
+        # Define the level generator used by new_level, and the seed of the current level
+        self.generator = BlockGenerator() if igenerator is None else igenerator
+        self.seed = None
+
+        # Renderers use these to redraw only what changed:
+        #   changed_tiles : tiles changed by gameplay since a renderer last cleared the list
+        #   map_version   : goes up every time the whole map is replaced
+        self.changed_tiles = []
+        self.map_version = 0
 
         # Define key and door
         self.key = Key(-1, -1)
         # Define key and door
         self.door = Door(-1, -1)
 
-        if enable_log:
-            log(f"Board initialized as {self.width} by {self.width} 2D list", 0)
+        logger.debug( "Board initialized as %d by %d tile grid", self.width, self.width )
 
         # Define a player and place it outside of map bounds
         # Engine.setup will place the player after the board has been generated
         self.player = Player(-1, -1)
 
+        # Line of sight and explored tiles, only used with fog of war. See FieldOfView
+        self.fov = None
+
+        # Rectangles waiting to be carved between begin_carve() and end_carve(), None otherwise
+        self.carved = None
+
     def board_clear( self ):
         # Set every cell in the board to be a WALL
-        for r in range(self.width):
-            for c in range(self.width):
-                self.board[r][c] = "WALL"
+        self.board.fill( TILE_WALL )
+        self.map_version += 1
+        self.changed_tiles.clear()
 
         # Set object locations to just outside of map
         self.player.x = -1
@@ -147,82 +760,107 @@ class Board:
         self.door.x = -1
         self.door.y = -1
 
-        if enable_log:
-            log(f"Board cleared to walls and player location set to [ {self.player.x}, {self.player.y} ]", 0)
+        logger.debug( "Board cleared to walls and player location set to [ %d, %d ]", self.player.x, self.player.y )
 
     # Return true if level complete
     def player_interaction( self ):
         # Check for key
         if [self.key.x, self.key.y] == [self.player.x, self.player.y]:
             # Move key off-screen
-            self.board[self.key.x][self.key.y] = "FLOOR"
+            self.board.set( self.key.x, self.key.y, TILE_FLOOR )
+            self.changed_tiles.append( ( self.key.x, self.key.y ) )
             self.key.x = -1
             self.key.y = -1
             # Unlock the door
             self.door.locked = False
-            self.board[self.door.x][self.door.y] = "UNLOCKED"
-            if enable_log:
-                log( f"Unlocked the door at [ {self.door.x}, {self.door.y} ]", 1)
+            # The door can be off the map when the board is a window onto a ChunkedWorld
+            if 0 <= self.door.x < self.width and 0 <= self.door.y < self.width:
+                self.board.set( self.door.x, self.door.y, TILE_UNLOCKED )
+                self.changed_tiles.append( ( self.door.x, self.door.y ) )
+            logger.info( "Unlocked the door at [ %d, %d ]", self.door.x, self.door.y )
             return False
 
         # Check for door
         if [self.door.x, self.door.y] == [self.player.x, self.player.y]:
             # Check for locked door
             if self.door.locked:
-                if enable_log:
-                    log( f"The door is still locked, find the key", 2 )
+                logger.info( "The door is still locked, find the key" )
                 return False
-            if enable_log:
-                log( f"You found the exit!", 2)
+            logger.info( "You found the exit!" )
             return True
 
-        if enable_log:
-            log( f"Nothing to interact with!", 1)
+        logger.debug( "Nothing to interact with!" )
         return False
 
-    def new_level( self ):
-
-        # Generate rooms in a random order
-        block_loc = [
-            [ 0, 0 ], [ 0, 1 ], [ 0, 2 ],
-            [ 1, 0 ], [ 1, 1 ], [ 1, 2 ],
-            [ 2, 0 ], [ 2, 1 ], [ 2, 2 ]
-        ]
-        random.shuffle( block_loc )
+    # Generate a new level using generator, or the board's own generator if none is given
+    # The generator fills self.rooms, carves the map, and places the player, key, and door
+    # Every level comes from a seed. The same seed, generator, and width always give the same level.
+    #   If no seed is given, a new one is picked at random
+    def new_level( self, generator=None, seed=None ):
+        if generator is None:
+            generator = self.generator
+        if seed is None:
+            seed = random.getrandbits( 32 )
+        self.seed = seed
 
         # Clear old rooms
         self.rooms = []
+        self.graph = RoomGraph( self.width, self.rooms )
 
-        while block_loc:
-            this_block = block_loc.pop()
-            rw = random.randint( 5, 19 )
-            rh = random.randint( 5, 19 )
-            rx = this_block[0]*20 + 1
-            ry = this_block[1]*20 + 1
-
-            self.place_room(rx, ry, rh, rw)
-
-
-        for r in range( len( self.rooms ) - 1 ):
-            self.connect_rooms( self.rooms[ r ], self.rooms[ r + 1 ] )
-
-
-        # Put the player in the middle of the first room
-        self.place_player( self.rooms[0].cx, self.rooms[0].cy )
-        # Put the door in the middle of the second room
-        rand_room = random.choice( self.rooms[1:len(self.rooms)-1] )
-        self.place_door( rand_room.cx, rand_room.cy )
-        # Put the key in the middle of the last room
-        self.place_key( self.rooms[-1].cx, self.rooms[-1].cy )
+        # Use a private generator so the level only depends on the seed
+        generator.generate( self, random.Random( seed ) )
+        self.map_version += 1
 
         self.door.locked = True
+        if self.fov is not None:
+            self.fov.reset()
+
+    # Return a Level holding a copy of the current map and object locations
+    def snapshot( self ):
+        return Level(
+            self.seed, self.width, bytes( self.board.cells ), list( self.rooms ),
+            ( self.player.x, self.player.y ), ( self.key.x, self.key.y ), ( self.door.x, self.door.y ),
+            self.door.locked, list( self.graph.edges )
+        )
+
+    # Replace the current level with level. The map is copied into the existing tile buffer
+    def load_level( self, level ):
+        if level.width != self.width:
+            raise ValueError( f"Cannot load a {level.width} tile level into a {self.width} tile board" )
+        # A level whose cells already are this board's grid ( see maze_save.LevelFile ) needs no copy
+        if level.cells is not self.board.cells:
+            self.board.cells[:] = level.cells
+        self.map_version += 1
+        self.changed_tiles.clear()
+        self.rooms = list( level.rooms )
+        self.graph = RoomGraph( self.width, self.rooms, list( level.edges ) )
+        self.seed = level.seed
+        self.player.x, self.player.y = level.player
+        self.key.x, self.key.y = level.key
+        self.door.x, self.door.y = level.door
+        self.door.locked = level.locked
+        if self.fov is not None:
+            self.fov.reset()
+
+    # Until end_carve() is called, place_room and connect_rooms only record the floor they carve.
+    #   end_carve() then fills it all in one pass. Used by generators that carve many rooms
+    def begin_carve( self ):
+        self.carved = []
+
+    def end_carve( self ):
+        carved = self.carved
+        self.carved = None
+        self.board.fill_rects( carved, TILE_FLOOR )
 
     def place_room( self, x, y, h, w ):
-        for r in range( x, x + w ):
-            for c in range( y, y + h ):
-                self.board[ r ][ c ] = "FLOOR"
+        if self.carved is None:
+            self.board.fill_rect( x, y, w, h, TILE_FLOOR )
+        else:
+            self.carved.append( ( x, y, w, h ) )
 
-        self.rooms.append( Room( x, y, w, h ) )
+        room = Room( x, y, w, h )
+        room.id = len( self.rooms )
+        self.rooms.append( room )
 
     def place_player( self, x, y ):
         self.player.x = x
@@ -231,18 +869,30 @@ class Board:
     def place_door( self, x, y ):
         self.door.x = x
         self.door.y = y
-        self.board[x][y] = "LOCKED"
+        self.board.set( x, y, TILE_LOCKED )
 
     def place_key( self, x, y ):
         self.key.x = x
         self.key.y = y
-        self.board[x][y] = "KEY"
+        self.board.set( x, y, TILE_KEY )
 
     def connect_rooms(self, rm1, rm2):
-        for x in range( min( rm1.cx, rm2.cx ), max( rm1.cx, rm2.cx ) + 1 ):
-            self.board[ x ][ rm1.cy ] = "FLOOR"
-        for y in range( min( rm1.cy, rm2.cy ), max( rm1.cy, rm2.cy ) + 1 ):
-            self.board[ rm2.cx ][ y ] = "FLOOR"
+        x1, y1, x2, y2 = rm1.cx, rm1.cy, rm2.cx, rm2.cy
+        dx = x2 - x1 if x2 > x1 else x1 - x2
+        dy = y2 - y1 if y2 > y1 else y1 - y2
+        # Horizontal tunnel along the first room's center row, then
+        #   vertical tunnel along the second room's center column
+        horizontal = ( x1 if x1 < x2 else x2, y1, dx + 1, 1 )
+        vertical = ( x2, y1 if y1 < y2 else y2, 1, dy + 1 )
+        if self.carved is None:
+            self.board.fill_rect( *horizontal, TILE_FLOOR )
+            self.board.fill_rect( *vertical, TILE_FLOOR )
+        else:
+            self.carved.append( horizontal )
+            self.carved.append( vertical )
+
+        # The tunnel is an edge in the room graph, weighted by the number of tiles carved
+        self.graph.add_edge( rm1.id, rm2.id, dx + dy + 1 )
 
     """
         Attempt to move the player
@@ -254,39 +904,1252 @@ class Board:
         return False if move failed
     """
     def move( self, dx, dy ):
+        player = self.player
+        nx = player.x + dx
+        ny = player.y + dy
         # Check upper bound
-        if self.player.y + dy < 0:
-            if enable_log:
-                log(f"Player at upper bound of map!", 1)
+        if ny < 0:
+            logger.debug( "Player at upper bound of map!" )
             return False
         # Check lower bound
-        if self.player.y + dy >= self.width:
-            if enable_log:
-                log(f"Player at lower bound of map!", 1)
+        if ny >= self.width:
+            logger.debug( "Player at lower bound of map!" )
             return False
         # Check left bound
-        if self.player.x + dx < 0:
-            if enable_log:
-                log(f"Player at left bound of map!", 1)
+        if nx < 0:
+            logger.debug( "Player at left bound of map!" )
             return False
         # Check right bound
-        if self.player.x + dx >= self.width:
-            if enable_log:
-                log(f"Player at right bound of map!", 1)
+        if nx >= self.width:
+            logger.debug( "Player at right bound of map!" )
             return False
 
-        # Check for collision with wall
-        if self.board[self.player.x + dx][self.player.y + dy] == "WALL":
-            if enable_log:
-                log( f"Player hit a wall at [ {self.player.x + dx}, {self.player.y + dy} ]", 1 )
+        # Check for collision with wall. Reads the tile buffer directly since this runs on every step
+        grid = self.board
+        if grid.cells[ nx * grid.height + ny ] == TILE_WALL:
+            logger.debug( "Player hit a wall at [ %d, %d ]", nx, ny )
         else:
-            self.player.x += dx
-            self.player.y += dy
-            if enable_log:
-                log( f"Player moved to [ {self.player.x}, {self.player.y} ]", 0 )
+            player.x = nx
+            player.y = ny
+            logger.debug( "Player moved to [ %d, %d ]", nx, ny )
+            if self.fov is not None:
+                self.fov.update()
 
         return True
 
+"""
+    Level Class
+
+    A finished level: the seed it was generated from, a copy of the tile codes, the rooms, and the
+        object locations. Levels are never changed after they are made, so they can be cached and
+        handed to Board.load_level any number of times
+"""
+class Level:
+    # iedges is the room graph's list of ( room, room, tunnel length ) edges
+    def __init__(self, iseed, iwidth, icells, irooms, iplayer, ikey, idoor, ilocked=True, iedges=None):
+        self.seed = iseed
+        self.width = iwidth
+        self.cells = icells
+        self.rooms = irooms
+        self.player = iplayer
+        self.key = ikey
+        self.door = idoor
+        self.locked = ilocked
+        self.edges = [] if iedges is None else iedges
+
+    # Rough number of bytes of memory the level holds on to. Rooms and edges are Python objects,
+    #   so on big maps they weigh about as much as the tiles
+    def size( self ):
+        return len( self.cells ) + 400 * len( self.rooms ) + 100 * len( self.edges )
+
+# Return a hashable description of a generator, used as part of a level cache key
+def generator_key( generator ):
+    return ( type( generator ).__name__, tuple( sorted( vars( generator ).items() ) ) )
+
+"""
+    Level Cache
+
+    A least recently used cache of finished levels. Keys are ( seed, width, generator_key )
+    The cache holds at most capacity levels and about max_bytes of them ( see Level.size ), so a
+        few big maps do not use as much memory as many small ones. The newest min_levels levels
+        are always kept, even past max_bytes
+"""
+class LevelCache:
+    def __init__(self, icapacity=32, imax_bytes=64 << 20, imin_levels=1):
+        self.capacity = icapacity
+        self.max_bytes = imax_bytes
+        self.min_levels = imin_levels
+        self.levels = OrderedDict()
+        self.bytes = 0
+
+    def __len__(self):
+        return len( self.levels )
+
+    def __contains__(self, key):
+        return key in self.levels
+
+    def get( self, key ):
+        level = self.levels.get( key )
+        if level is not None:
+            self.levels.move_to_end( key )
+        return level
+
+    def put( self, key, level ):
+        old = self.levels.pop( key, None )
+        if old is not None:
+            self.bytes -= old.size()
+        self.levels[ key ] = level
+        self.bytes += level.size()
+        while len( self.levels ) > self.min_levels and ( len( self.levels ) > self.capacity or self.bytes > self.max_bytes ):
+            self.bytes -= self.levels.popitem( last=False )[1].size()
+
+"""
+    Level Pregenerator
+
+    Hands out levels for a sequence of seeds drawn from one master seed. Once start() is called a
+        background thread builds the next `ahead` levels into the cache, so next_level() is
+        normally just a cache lookup. Without the thread, levels are built when they are asked for
+"""
+class LevelPregenerator:
+    # icache_bytes bounds the memory used by cached levels, but the `ahead` upcoming levels and the
+    #   current one are always kept
+    def __init__(self, iwidth, igenerator=None, iseed=None, iahead=3, icache_size=32, icache_bytes=64 << 20):
+        self.width = iwidth
+        self.generator = BlockGenerator() if igenerator is None else igenerator
+        self.seeds = random.Random( iseed )
+        self.ahead = iahead
+        self.cache = LevelCache( max( icache_size, iahead + 1 ), icache_bytes, iahead + 1 )
+
+        # Seeds handed out next, in order, and the ones the worker still has to build
+        self.upcoming = deque()
+        self.pending = deque()
+        self.building = None
+
+        self.lock = threading.Condition()
+        self.worker = None
+        self.running = False
+
+    def key( self, seed ):
+        return ( seed, self.width, generator_key( self.generator ) )
+
+    # Generate the level for seed on board and return it
+    def build( self, board, seed ):
+        board.board_clear()
+        board.new_level( self.generator, seed )
+        return board.snapshot()
+
+    def start( self ):
+        if self.worker is not None:
+            return
+        self.running = True
+        self.worker = threading.Thread( target=self.work, name="level-pregenerator", daemon=True )
+        self.worker.start()
+        with self.lock:
+            self.queue_upcoming()
+
+    def stop( self ):
+        if self.worker is None:
+            return
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+        self.worker.join()
+        self.worker = None
+
+    # Make sure the next `ahead` seeds are picked. Must hold the lock
+    def queue_upcoming( self ):
+        while len( self.upcoming ) < self.ahead:
+            seed = self.seeds.getrandbits( 32 )
+            self.upcoming.append( seed )
+            if self.running and self.key( seed ) not in self.cache:
+                self.pending.append( seed )
+        self.lock.notify_all()
+
+    # Return the next seed in the sequence. level() then returns its level
+    def next_seed( self ):
+        with self.lock:
+            if not self.upcoming:
+                self.queue_upcoming()
+            seed = self.upcoming.popleft()
+            self.queue_upcoming()
+        return seed
+
+    # Return the level for the next seed in the sequence
+    def next_level( self ):
+        return self.level( self.next_seed() )
+
+    # Return the level for seed, waiting on or taking over its generation if it is not cached yet
+    def level( self, seed ):
+        key = self.key( seed )
+        with self.lock:
+            while True:
+                level = self.cache.get( key )
+                if level is not None:
+                    return level
+                if self.building != seed:
+                    break
+                self.lock.wait()
+            if seed in self.pending:
+                self.pending.remove( seed )
+
+        level = self.build( Board( self.width, self.generator ), seed )
+        with self.lock:
+            self.cache.put( key, level )
+            self.lock.notify_all()
+        return level
+
+    # Background thread: build pending levels into the cache until stopped
+    def work( self ):
+        board = Board( self.width, self.generator )
+        while True:
+            with self.lock:
+                while self.running and not self.pending:
+                    self.lock.wait()
+                if not self.running:
+                    return
+                seed = self.building = self.pending.popleft()
+
+            level = self.build( board, seed )
+            with self.lock:
+                self.cache.put( self.key( seed ), level )
+                self.building = None
+                self.lock.notify_all()
+
+"""
+    Chunked World
+
+    An endless map split into chunk_size square chunks. Every chunk is carved by a BSPGenerator
+        from its own seed, made from the world seed and the chunk's coordinates, so any chunk can be
+        built on its own at any time and always comes out the same.
+
+    Each side of a chunk has one portal: a tile on the chunk border whose position comes from the
+        world seed and the coordinates of that side. Both chunks that share a side work out the same
+        portal and tunnel from it to their nearest room, so tunnels line up across chunk borders
+        without either chunk looking at the other.
+
+    The game plays on a normal Board that holds a window of window by window chunks around the
+        player. follow() slides the window whenever the player leaves its center chunk, writing the
+        old chunks back and copying the new ones in. Chunks are kept in a least recently used cache
+        of cache_size chunks. Chunks that play has changed ( the key was picked up ) are written to
+        directory when they are evicted, or kept in memory if there is no directory. Memory use only
+        depends on the window and cache sizes, not on how far the player goes.
+
+    The player starts in the first room of chunk [ 0, 0 ], the door is in a random room of the same
+        chunk, and the key is in the last room of a chunk key_distance chunks away
+"""
+class ChunkedWorld:
+    def __init__(self, iseed, ichunk_size=64, iwindow=3, icache_size=32, idirectory=None, igenerator=None, ikey_distance=2):
+        if iwindow < 3 or iwindow % 2 == 0:
+            raise ValueError( f"The window must be an odd number of chunks, at least 3, got {iwindow}" )
+        self.seed = iseed
+        self.chunk_size = ichunk_size
+        self.window = iwindow
+        self.cache_size = max( icache_size, iwindow * iwindow )
+        self.directory = idirectory
+        self.generator = BSPGenerator() if igenerator is None else igenerator
+        self.cache = OrderedDict()
+        # Chunks changed by play that were evicted while there was no directory to write them to
+        self.pinned = {}
+        # Coordinates of the chunks changed by play
+        self.modified = set()
+
+        # Chunk coordinates of the window's top left chunk
+        self.origin = None
+
+        # Objects, in world tile coordinates
+        start = self.chunk_rooms( 0, 0 )
+        self.player = ( start[0].cx, start[0].cy )
+        door_room = random.Random( f"{iseed}:door" ).choice( start[1:] or start )
+        self.door = ( door_room.cx, door_room.cy )
+        angle = random.Random( f"{iseed}:key" ).randrange( 4 )
+        kcx, kcy = ( ( ikey_distance, 0 ), ( 0, ikey_distance ), ( -ikey_distance, 0 ), ( 0, -ikey_distance ) )[ angle ]
+        key_room = self.chunk_rooms( kcx, kcy )[-1]
+        self.key = ( kcx * ichunk_size + key_room.cx, kcy * ichunk_size + key_room.cy )
+        self.locked = True
+
+        if idirectory is not None:
+            os.makedirs( idirectory, exist_ok=True )
+
+    # Width in tiles of the Board the window is played on
+    @property
+    def board_width( self ):
+        return self.window_width( self.chunk_size, self.window )
+
+    # Width in tiles of the window for the given sizes, without making ( and carving ) a world
+    @staticmethod
+    def window_width( chunk_size=64, window=3 ):
+        return chunk_size * window
+
+    # Offset of the portal on the side of chunk [ cx, cy ] facing west ( side "x" ) or north ( side "y" )
+    def portal( self, side, cx, cy ):
+        return random.Random( f"{self.seed}:{side}:{cx}:{cy}" ).randint( 1, self.chunk_size - 2 )
+
+    # Carve chunk [ cx, cy ] into board, which must be chunk_size wide. Returns the chunk's rooms
+    def carve_chunk( self, board, cx, cy ):
+        size = self.chunk_size
+        board.board_clear()
+        board.rooms = []
+        board.graph = RoomGraph( size, board.rooms )
+        self.generator.carve( board, random.Random( f"{self.seed}:{cx}:{cy}" ) )
+
+        # Tunnel from each portal to the nearest room center
+        portals = (
+            ( 0, self.portal( "x", cx, cy ) ),
+            ( size - 1, self.portal( "x", cx + 1, cy ) ),
+            ( self.portal( "y", cx, cy ), 0 ),
+            ( self.portal( "y", cx, cy + 1 ), size - 1 ),
+        )
+        for px, py in portals:
+            room = min( board.rooms, key=lambda room: abs( room.cx - px ) + abs( room.cy - py ) )
+            x0 = min( px, room.cx )
+            board.board.fill_rect( x0, py, max( px, room.cx ) + 1 - x0, 1, TILE_FLOOR )
+            y0 = min( py, room.cy )
+            board.board.fill_rect( room.cx, y0, 1, max( py, room.cy ) + 1 - y0, TILE_FLOOR )
+        return board.rooms
+
+    def chunk_rooms( self, cx, cy ):
+        return self.carve_chunk( Board( self.chunk_size ), cx, cy )
+
+    # Build the tiles of chunk [ cx, cy ] as it was generated, with the objects in it stamped on
+    def build_chunk( self, cx, cy ):
+        board = Board( self.chunk_size )
+        self.carve_chunk( board, cx, cy )
+        ox = cx * self.chunk_size
+        oy = cy * self.chunk_size
+        for ( x, y ), code in ( ( self.key, TILE_KEY if self.locked else TILE_FLOOR ),
+                                ( self.door, TILE_LOCKED if self.locked else TILE_UNLOCKED ) ):
+            if 0 <= x - ox < self.chunk_size and 0 <= y - oy < self.chunk_size:
+                board.board.set( x - ox, y - oy, code )
+        return bytearray( board.board.cells )
+
+    def chunk_path( self, cx, cy ):
+        return os.path.join( self.directory, f"{self.seed}_{cx}_{cy}.chunk" )
+
+    # Return the tiles of chunk [ cx, cy ] as a column-major bytearray
+    def chunk( self, cx, cy ):
+        key = ( cx, cy )
+        cells = self.cache.get( key )
+        if cells is not None:
+            self.cache.move_to_end( key )
+            return cells
+
+        cells = self.pinned.pop( key, None )
+        if cells is None and key in self.modified and self.directory is not None:
+            with open( self.chunk_path( cx, cy ), "rb" ) as file:
+                cells = bytearray( file.read() )
+        if cells is None:
+            cells = self.build_chunk( cx, cy )
+        self.store( key, cells )
+        return cells
+
+    def store( self, key, cells ):
+        self.cache[ key ] = cells
+        self.cache.move_to_end( key )
+        while len( self.cache ) > self.cache_size:
+            old_key, old_cells = self.cache.popitem( last=False )
+            if old_key not in self.modified:
+                continue
+            if self.directory is None:
+                self.pinned[ old_key ] = old_cells
+            else:
+                with open( self.chunk_path( *old_key ), "wb" ) as file:
+                    file.write( old_cells )
+
+    # Fill board with the window centered on the player's chunk
+    def attach( self, board ):
+        size = self.chunk_size
+        old_origin = self.origin
+        self.origin = ( self.player[0] // size - self.window // 2, self.player[1] // size - self.window // 2 )
+        ocx, ocy = self.origin
+        cells = board.board.cells
+        height = board.width
+        for i in range( self.window ):
+            for j in range( self.window ):
+                chunk = self.chunk( ocx + i, ocy + j )
+                for x in range( size ):
+                    start = ( i * size + x ) * height + j * size
+                    cells[ start : start + size ] = chunk[ x * size : x * size + size ]
+
+        board.seed = self.seed
+        board.rooms = []
+        board.graph = RoomGraph( board.width, board.rooms )
+        board.changed_tiles.clear()
+        board.map_version += 1
+        ox = ocx * size
+        oy = ocy * size
+        board.player.x, board.player.y = self.player[0] - ox, self.player[1] - oy
+        board.door.x, board.door.y = self.door[0] - ox, self.door[1] - oy
+        board.door.locked = self.locked
+        if self.locked:
+            board.key.x, board.key.y = self.key[0] - ox, self.key[1] - oy
+        else:
+            board.key.x, board.key.y = -1, -1
+
+        # Explored tiles move along with the window
+        if board.fov is not None:
+            if old_origin is None:
+                board.fov.reset()
+            else:
+                board.fov.shift( ( old_origin[0] - ocx ) * size, ( old_origin[1] - ocy ) * size )
+
+    # Copy the window on board back into the chunks, marking the ones play has changed
+    def detach( self, board ):
+        size = self.chunk_size
+        ocx, ocy = self.origin
+        ox = ocx * size
+        oy = ocy * size
+        self.player = ( board.player.x + ox, board.player.y + oy )
+        if self.locked and not board.door.locked:
+            self.locked = False
+            # Unlock the door in its own chunk, in case it is outside the window
+            dcx = self.door[0] // size
+            dcy = self.door[1] // size
+            self.chunk( dcx, dcy )[ ( self.door[0] - dcx * size ) * size + self.door[1] - dcy * size ] = TILE_UNLOCKED
+            self.modified.add( ( dcx, dcy ) )
+        cells = board.board.cells
+        height = board.width
+        for i in range( self.window ):
+            for j in range( self.window ):
+                chunk = self.chunk( ocx + i, ocy + j )
+                window = bytearray( size * size )
+                for x in range( size ):
+                    start = ( i * size + x ) * height + j * size
+                    window[ x * size : x * size + size ] = cells[ start : start + size ]
+                if window != chunk:
+                    chunk[:] = window
+                    self.modified.add( ( ocx + i, ocy + j ) )
+
+    # Slide the window if the player has left its center chunk. Returns True if it moved
+    def follow( self, board ):
+        center = self.window // 2
+        if board.player.x // self.chunk_size == center and board.player.y // self.chunk_size == center:
+            return False
+        self.detach( board )
+        self.attach( board )
+        logger.debug( "World window moved to chunk [ %d, %d ]", *self.origin )
+        return True
+
+"""
+    Field of View
+
+    Fog of war for a Board. visible holds the tiles the player can see right now: every tile within
+        radius of the player that symmetric shadowcasting says is in line of sight. Walls block
+        sight, everything else is see-through. explored is a bitmask of every tile that has been
+        visible since the level started, one bit per tile, with each column starting on a byte
+        boundary ( bit y % 8 of byte x * column_bytes + y // 8 ).
+
+    update() is called by Board.move only when the player actually moves, and only looks at the
+        tiles within radius. Tiles whose visibility changed are added to Board.changed_tiles so
+        renderers redraw just those
+
+    Shadowcasting follows Albert Ford's "Symmetric Shadowcasting": each quarter of the view is
+        scanned row by row outward from the player, narrowing the range of slopes that can still be
+        seen past walls. Slopes are kept as fractions of integers so no rounding can break symmetry
+"""
+class FieldOfView:
+    # Tile shades, added to the tile code to get its palette index. See Engine.display_code()
+    SHADE_UNSEEN     = 0
+    SHADE_REMEMBERED = 8
+    SHADE_VISIBLE    = 16
+
+    # How depth and column map to x and y in each quarter: ( x per column, x per depth, y per column, y per depth )
+    QUADRANTS = ( ( 1, 0, 0, -1 ), ( 1, 0, 0, 1 ), ( 0, 1, 1, 0 ), ( 0, -1, 1, 0 ) )
+
+    def __init__(self, iboard, iradius=8):
+        self.board = iboard
+        self.radius = iradius
+        self.column_bytes = ( iboard.width + 7 ) // 8
+        self.explored = bytearray( iboard.width * self.column_bytes )
+        self.visible = set()
+
+    def is_explored( self, x, y ):
+        return self.explored[ x * self.column_bytes + ( y >> 3 ) ] >> ( y & 7 ) & 1
+
+    # Shade of tile [ x, y ], one of the SHADE_* values
+    def shade( self, x, y ):
+        if ( x, y ) in self.visible:
+            return self.SHADE_VISIBLE
+        if self.explored[ x * self.column_bytes + ( y >> 3 ) ] >> ( y & 7 ) & 1:
+            return self.SHADE_REMEMBERED
+        return self.SHADE_UNSEEN
+
+    # Forget everything and look around from where the player is. Used when a new level is loaded
+    def reset( self ):
+        self.explored = bytearray( len( self.explored ) )
+        self.visible = set()
+        self.update()
+
+    # Move the explored tiles by dx, dy tiles, dropping the ones that leave the map
+    # dy must be a multiple of 8, or everything is forgotten
+    def shift( self, dx, dy ):
+        if dy % 8 != 0:
+            self.reset()
+            return
+        width = self.board.width
+        column_bytes = self.column_bytes
+        shifted = bytearray( len( self.explored ) )
+        row_shift = dy // 8
+        for x in range( max( 0, -dx ), min( width, width - dx ) ):
+            source = x * column_bytes
+            target = ( x + dx ) * column_bytes
+            lo = max( 0, -row_shift )
+            hi = min( column_bytes, column_bytes - row_shift )
+            if lo < hi:
+                shifted[ target + lo + row_shift : target + hi + row_shift ] = self.explored[ source + lo : source + hi ]
+        self.explored = shifted
+        self.visible = set()
+        self.update()
+
+    # Recompute what the player sees and mark newly seen tiles as explored
+    def update( self ):
+        board = self.board
+        ox = board.player.x
+        oy = board.player.y
+        width = board.width
+        if not ( 0 <= ox < width and 0 <= oy < width ):
+            visible = set()
+        else:
+            visible = self.cast( ox, oy )
+
+        changed = visible.symmetric_difference( self.visible )
+        self.visible = visible
+        explored = self.explored
+        column_bytes = self.column_bytes
+        for x, y in visible:
+            explored[ x * column_bytes + ( y >> 3 ) ] |= 1 << ( y & 7 )
+        board.changed_tiles.extend( changed )
+
+    # Return the set of tiles visible from [ ox, oy ]
+    def cast( self, ox, oy ):
+        cells = self.board.board.cells
+        height = self.board.board.height
+        width = self.board.width
+        radius = self.radius
+        limit = radius * radius + radius
+        visible = { ( ox, oy ) }
+
+        for cx, dx, cy, dy in self.QUADRANTS:
+            # Rows to scan as ( depth, start slope, end slope ), slopes as ( numerator, denominator )
+            rows = [ ( 1, ( -1, 1 ), ( 1, 1 ) ) ]
+            while rows:
+                depth, start, end = rows.pop()
+                if depth > radius:
+                    continue
+                # Columns from round_ties_up( depth * start ) to round_ties_down( depth * end )
+                first = ( 2 * depth * start[0] + start[1] ) // ( 2 * start[1] )
+                last = -( ( end[1] - 2 * depth * end[0] ) // ( 2 * end[1] ) )
+                previous_wall = None
+                for col in range( first, last + 1 ):
+                    x = ox + col * cx + depth * dx
+                    y = oy + col * cy + depth * dy
+                    inside = 0 <= x < width and 0 <= y < height
+                    wall = not inside or cells[ x * height + y ] == TILE_WALL
+                    # Walls are always shown, floors only if they are symmetric ( inside the slopes )
+                    if inside and col * col + depth * depth <= limit and (
+                            wall or ( col * start[1] >= depth * start[0] and col * end[1] <= depth * end[0] ) ):
+                        visible.add( ( x, y ) )
+                    if previous_wall is True and not wall:
+                        start = ( 2 * col - 1, 2 * depth )
+                    if previous_wall is False and wall:
+                        rows.append( ( depth + 1, start, ( 2 * col - 1, 2 * depth ) ) )
+                    previous_wall = wall
+                if previous_wall is False:
+                    rows.append( ( depth + 1, start, end ) )
+        return visible
+
+"""
+    Path Finder
+
+    Shortest paths over a Board's tile grid. Every tile except WALL can be walked on, and the player
+        moves one tile up, down, left, or right per step, so every step costs 1.
+
+    A distance field holds the number of steps from one tile to every other tile ( -1 where it
+        cannot be reached ). Fields are cached by tile until a new level is loaded, so after the
+        first query for a tile, distances to it are a single lookup. Big maps build fields with a
+        vectorized frontier expansion when NumPy is installed, and with an array-based queue otherwise
+"""
+class PathFinder:
+    # Maps with at least this many tiles use the NumPy frontier expansion when it is available
+    numpy_min_tiles = 1 << 16
+
+    def __init__(self, iboard, icache_size=8):
+        self.board = iboard
+        self.cache_size = icache_size
+        self.fields = OrderedDict()
+        self.map_version = iboard.map_version
+
+    # Throw away cached fields if the board has a new level. Walls never change during a level
+    def check_version( self ):
+        if self.map_version != self.board.map_version:
+            self.fields.clear()
+            self.map_version = self.board.map_version
+
+    # Return the distance field of tile [ x, y ]. Index it with x * height + y
+    def field( self, x, y ):
+        self.check_version()
+        grid = self.board.board
+        start = x * grid.height + y
+        field = self.fields.get( start )
+        if field is not None:
+            self.fields.move_to_end( start )
+            return field
+
+        if len( grid.cells ) >= self.numpy_min_tiles and load_numpy() is not None:
+            field = self.expand_numpy( grid, start )
+        else:
+            field = self.expand_queue( grid, start )
+
+        self.fields[ start ] = field
+        while len( self.fields ) > self.cache_size:
+            self.fields.popitem( last=False )
+        return field
+
+    # Breadth first search with a flat array as the queue
+    @staticmethod
+    def expand_queue( grid, start ):
+        cells = grid.cells
+        h = grid.height
+        n = len( cells )
+        dist = array( "i", [ -1 ] ) * n
+        dist[ start ] = 0
+        queue = array( "i", [ start ] )
+        head = 0
+        while head < len( queue ):
+            i = queue[ head ]
+            head += 1
+            d = dist[ i ] + 1
+            y = i % h
+            # WALL is tile code 0, so any non-zero tile can be walked on
+            if y > 0 and dist[ i - 1 ] < 0 and cells[ i - 1 ]:
+                dist[ i - 1 ] = d
+                queue.append( i - 1 )
+            if y < h - 1 and dist[ i + 1 ] < 0 and cells[ i + 1 ]:
+                dist[ i + 1 ] = d
+                queue.append( i + 1 )
+            if i >= h and dist[ i - h ] < 0 and cells[ i - h ]:
+                dist[ i - h ] = d
+                queue.append( i - h )
+            if i + h < n and dist[ i + h ] < 0 and cells[ i + h ]:
+                dist[ i + h ] = d
+                queue.append( i + h )
+        return dist
+
+    # Breadth first search one whole frontier at a time with NumPy
+    @staticmethod
+    def expand_numpy( grid, start ):
+        # Surround the map with a ring of walls so neighbors never need a bounds check
+        w = grid.width
+        h = grid.height
+        ph = h + 2
+        open_tiles = numpy.zeros( ( w + 2, ph ), dtype=bool )
+        open_tiles[ 1 : -1, 1 : -1 ] = numpy.frombuffer( grid.cells, dtype=numpy.uint8 ).reshape( w, h ) != TILE_WALL
+        open_tiles = open_tiles.ravel()
+        dist = numpy.full( open_tiles.size, -1, dtype=numpy.int32 )
+        # Scratch space used to drop tiles found twice in one pass
+        first = numpy.zeros( open_tiles.size, dtype=numpy.int32 )
+
+        frontier = numpy.array( [ ( start // h + 1 ) * ph + start % h + 1 ], dtype=numpy.int64 )
+        open_tiles[ frontier ] = False
+        dist[ frontier ] = 0
+        d = 0
+        while frontier.size:
+            d += 1
+            neighbors = numpy.concatenate( ( frontier - 1, frontier + 1, frontier - ph, frontier + ph ) )
+            neighbors = neighbors[ open_tiles[ neighbors ] ]
+            positions = numpy.arange( neighbors.size, dtype=numpy.int32 )
+            first[ neighbors ] = positions
+            frontier = neighbors[ first[ neighbors ] == positions ]
+            open_tiles[ frontier ] = False
+            dist[ frontier ] = d
+        # Strip the ring of walls back off
+        return dist.reshape( w + 2, ph )[ 1 : -1, 1 : -1 ].ravel()
+
+    # True if both [ x0, y0 ] and [ x1, y1 ] are on the map. Tiles are looked up by flat index,
+    #   so an off-map tile would otherwise wrap around to some other tile
+    def on_map( self, x0, y0, x1, y1 ):
+        grid = self.board.board
+        return ( 0 <= x0 < grid.width and 0 <= y0 < grid.height and
+                 0 <= x1 < grid.width and 0 <= y1 < grid.height )
+
+    # Steps from [ x0, y0 ] to [ x1, y1 ], -1 if there is no path, or None if either end is off the map
+    def distance( self, x0, y0, x1, y1 ):
+        if not self.on_map( x0, y0, x1, y1 ):
+            return None
+        return int( self.field( x1, y1 )[ x0 * self.board.board.height + y0 ] )
+
+    # Shortest path from [ x0, y0 ] to [ x1, y1 ] as a list of tiles, both ends included, or None
+    #   if there is no path or either end is off the map
+    # Walks down the target's distance field, so it is cheap once that field is cached
+    def path( self, x0, y0, x1, y1 ):
+        if not self.on_map( x0, y0, x1, y1 ):
+            return None
+        field = self.field( x1, y1 )
+        h = self.board.board.height
+        n = len( field )
+        i = x0 * h + y0
+        d = int( field[ i ] )
+        if d < 0:
+            return None
+        path = [ ( x0, y0 ) ]
+        while d > 0:
+            y = i % h
+            for j in ( i - 1 if y > 0 else -1, i + 1 if y < h - 1 else -1, i - h, i + h ):
+                if 0 <= j < n and field[ j ] == d - 1:
+                    break
+            i = j
+            d -= 1
+            path.append( ( i // h, i % h ) )
+        return path
+
+    # A* search from [ x0, y0 ] to [ x1, y1 ] with the Manhattan distance as the heuristic
+    # Good for one-off queries on big maps where a whole distance field is not worth building
+    def astar( self, x0, y0, x1, y1 ):
+        if not self.on_map( x0, y0, x1, y1 ):
+            return None
+        grid = self.board.board
+        cells = grid.cells
+        h = grid.height
+        n = len( cells )
+        start = x0 * h + y0
+        goal = x1 * h + y1
+        came_from = { start: -1 }
+        cost = { start: 0 }
+        heap = [ ( abs( x1 - x0 ) + abs( y1 - y0 ), 0, start ) ]
+        while heap:
+            _, g, i = heapq.heappop( heap )
+            if i == goal:
+                path = []
+                while i >= 0:
+                    path.append( ( i // h, i % h ) )
+                    i = came_from[ i ]
+                path.reverse()
+                return path
+            if g > cost[ i ]:
+                continue
+            y = i % h
+            for j in ( i - 1 if y > 0 else -1, i + 1 if y < h - 1 else -1, i - h, i + h ):
+                if j < 0 or j >= n or not cells[ j ]:
+                    continue
+                if g + 1 < cost.get( j, n ):
+                    cost[ j ] = g + 1
+                    came_from[ j ] = i
+                    heapq.heappush( heap, ( g + 1 + abs( x1 - j // h ) + abs( y1 - j % h ), g + 1, j ) )
+        return None
+
+    # Steps for each leg of a route through points [ ( x, y ), ... ], or None if any leg is blocked
+    def route( self, points ):
+        legs = []
+        for ( x0, y0 ), ( x1, y1 ) in zip( points, points[1:] ):
+            d = self.distance( x0, y0, x1, y1 )
+            if d is None or d < 0:
+                return None
+            legs.append( d )
+        return legs
+
+    # Steps for each leg of the current objective: player -> key -> door, or player -> door once
+    #   the key has been picked up. None if the level cannot be finished
+    def objective_route( self ):
+        board = self.board
+        points = [ ( board.player.x, board.player.y ) ]
+        if board.key.x >= 0:
+            points.append( ( board.key.x, board.key.y ) )
+        points.append( ( board.door.x, board.door.y ) )
+        return self.route( points )
+
+    # True if the player can reach the key and then the door
+    def solvable( self ):
+        return self.objective_route() is not None
+
+"""
+    Actions
+
+    Game actions as small integers, shared by the headless runner and anything that scripts or
+        records input. MOVES gives the ( dx, dy ) of each move action, and ACTION_CHARS maps the
+        characters used in text scripts to actions
+"""
+ACTION_RIGHT     = 0
+ACTION_LEFT      = 1
+ACTION_UP        = 2
+ACTION_DOWN      = 3
+ACTION_INTERACT  = 4
+ACTION_NEW_LEVEL = 5
+# Zooming only changes what the Engine draws. The headless runner ignores it
+ACTION_ZOOM_IN   = 6
+ACTION_ZOOM_OUT  = 7
+MOVES = { ACTION_RIGHT: ( 1, 0 ), ACTION_LEFT: ( -1, 0 ), ACTION_UP: ( 0, -1 ), ACTION_DOWN: ( 0, 1 ) }
+ACTION_CHARS = {
+    "d": ACTION_RIGHT, "a": ACTION_LEFT, "w": ACTION_UP, "s": ACTION_DOWN,
+    " ": ACTION_INTERACT, "r": ACTION_NEW_LEVEL,
+}
+
+# Turn a text script such as "ddds r" into a list of actions. Characters that are not actions are skipped
+def parse_script( text ):
+    return [ ACTION_CHARS[ c ] for c in text.lower() if c in ACTION_CHARS ]
+
+"""
+    Headless Runner
+
+    Plays the game on a Board without PyGame or a display. Actions come from any iterable of action
+        codes ( a script, a generator, a bot ). Levels come from a LevelPregenerator, so a seed
+        always replays the same way. Counts steps and levels so throughput can be reported
+"""
+class HeadlessRunner:
+    def __init__(self, iwidth=61, igenerator=None, iseed=None):
+        self.board = Board( iwidth, igenerator )
+        self.levels = LevelPregenerator( iwidth, self.board.generator, iseed )
+        self.steps = 0
+        self.levels_played = 0
+        self.levels_completed = 0
+        self.levels_generated = 0
+        # Seconds spent running actions, and seconds spent in run_levels
+        self.step_time = 0.0
+        self.level_time = 0.0
+        self.setup()
+
+    # Load the next level
+    def setup( self ):
+        self.board.load_level( self.levels.next_level() )
+        self.levels_played += 1
+
+    # Apply one action. Returns True if it finished the level
+    def step( self, action ):
+        self.steps += 1
+        if action in MOVES:
+            dx, dy = MOVES[ action ]
+            self.board.move( dx, dy )
+        elif action == ACTION_INTERACT:
+            if self.board.player_interaction():
+                self.levels_completed += 1
+                self.setup()
+                return True
+        elif action == ACTION_NEW_LEVEL:
+            self.setup()
+        return False
+
+    # Apply every action in actions ( up to max_steps of them ) and return the stats
+    def run( self, actions, max_steps=None ):
+        board = self.board
+        move = board.move
+        moves = [ MOVES.get( action ) for action in range( ACTION_ZOOM_OUT + 1 ) ]
+        steps = 0
+        start = time.perf_counter()
+        for action in actions:
+            if max_steps is not None and steps >= max_steps:
+                break
+            steps += 1
+            # Inline the common case of step()
+            delta = moves[ action ]
+            if delta is not None:
+                move( delta[0], delta[1] )
+            elif action == ACTION_INTERACT:
+                if board.player_interaction():
+                    self.levels_completed += 1
+                    self.setup()
+            elif action == ACTION_NEW_LEVEL:
+                self.setup()
+        self.step_time += time.perf_counter() - start
+        self.steps += steps
+        return self.stats()
+
+    # Load the level for seed, outside of the usual sequence
+    def load( self, seed ):
+        self.board.load_level( self.levels.level( seed ) )
+        self.levels_played += 1
+
+    # Player position and door state, to compare with the end of a journal
+    def state( self ):
+        return ( self.board.player.x, self.board.player.y, self.board.door.locked )
+
+    """
+        Play back a recorded Journal as fast as possible
+
+        Levels are loaded from the seeds in the journal instead of the runner's own sequence, so
+            the replay does not depend on how the recorded session was seeded. Returns True if the
+            replay ended in the same state as the recorded session ( or the journal has no end )
+    """
+    def replay( self, journal ):
+        if journal.world:
+            raise ValueError( "The headless runner cannot replay a world mode journal" )
+        if journal.width != self.board.width:
+            raise ValueError( f"The journal was recorded on a {journal.width} tile map, not {self.board.width}" )
+        board = self.board
+        steps = 0
+        start = time.perf_counter()
+        for frame, kind, value in journal.events:
+            if kind == JOURNAL_LEVEL:
+                self.load( value )
+                continue
+            steps += 1
+            if value in MOVES:
+                board.move( *MOVES[ value ] )
+            elif value == ACTION_INTERACT:
+                # The journal loads the next level itself
+                if board.player_interaction():
+                    self.levels_completed += 1
+        self.step_time += time.perf_counter() - start
+        self.steps += steps
+        return journal.matches( self.state() )
+
+    # Generate count levels back to back and return the stats
+    def run_levels( self, count ):
+        start = time.perf_counter()
+        for _ in range( count ):
+            self.setup()
+        self.level_time += time.perf_counter() - start
+        self.levels_generated += count
+        return self.stats()
+
+    def stats( self ):
+        return {
+            "steps": self.steps,
+            "levels_played": self.levels_played,
+            "levels_completed": self.levels_completed,
+            "step_seconds": self.step_time,
+            "level_seconds": self.level_time,
+            "steps_per_sec": self.steps / max( self.step_time, 1e-9 ),
+            "levels_per_sec": self.levels_generated / max( self.level_time, 1e-9 ),
+        }
+
+# Return count random actions as bytes: mostly moves, with an interaction now and then
+def random_actions( count, seed=None, interact_chance=0.1 ):
+    # Map every byte value to an action, then translate a block of random bytes in one go
+    cutoff = int( interact_chance * 256 )
+    table = bytes( ACTION_INTERACT if b < cutoff else b % 4 for b in range( 256 ) )
+    # Same bytes as Random.randbytes, which Python 3.8 does not have
+    if count <= 0:
+        return b""
+    data = random.Random( seed ).getrandbits( 8 * count ).to_bytes( count, "little" )
+    return data.translate( table )
+
+"""
+    Input Journal
+
+    A compact binary record of a play session. It starts with a header ( magic "MZIJ", format
+        version, world mode flag, map width, frames per second ) followed by one record per event:
+
+        action code       , frame change                     -> the player did this
+        JOURNAL_LEVEL tag , frame change , seed              -> a level ( or world ) was loaded
+        JOURNAL_END tag   , frame change , x , y , locked    -> the session ended in this state
+
+    Numbers are unsigned LEB128 varints, and the player position is zigzag encoded since world
+        positions can be negative. Frames count 1 / fps second ticks from the start of the session,
+        so most records take two bytes
+"""
+JOURNAL_MAGIC = b"MZIJ"
+JOURNAL_VERSION = 1
+JOURNAL_HEADER = struct.Struct( "<4sBBIH" )
+JOURNAL_LEVEL = 0xFE
+JOURNAL_END = 0xFF
+
+def pack_varint( out, value ):
+    while value > 0x7F:
+        out.append( ( value & 0x7F ) | 0x80 )
+        value >>= 7
+    out.append( value )
+
+def unpack_varint( data, offset ):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[ offset ]
+        offset += 1
+        value |= ( byte & 0x7F ) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+def zigzag( value ):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def unzigzag( value ):
+    return value // 2 if value % 2 == 0 else -( value + 1 ) // 2
+
+# Writes a journal to path as the session goes. Records are buffered and written in blocks
+class JournalWriter:
+    def __init__(self, ipath, iwidth, ifps=60, iworld=False):
+        self.file = open( ipath, "wb" )
+        self.file.write( JOURNAL_HEADER.pack( JOURNAL_MAGIC, JOURNAL_VERSION, iworld, iwidth, ifps ) )
+        self.buffer = bytearray()
+        self.frame = 0
+
+    def record( self, tag, frame ):
+        self.buffer.append( tag )
+        pack_varint( self.buffer, max( frame - self.frame, 0 ) )
+        self.frame = max( frame, self.frame )
+
+    def action( self, frame, action ):
+        self.record( action, frame )
+        if len( self.buffer ) >= 1 << 16:
+            self.flush()
+
+    def level( self, frame, seed ):
+        self.record( JOURNAL_LEVEL, frame )
+        pack_varint( self.buffer, seed )
+
+    def flush( self ):
+        self.file.write( self.buffer )
+        self.buffer.clear()
+
+    # Record the final state ( x, y, locked ) and close the file
+    def close( self, frame, state ):
+        if self.file is None:
+            return
+        self.record( JOURNAL_END, frame )
+        pack_varint( self.buffer, zigzag( state[0] ) )
+        pack_varint( self.buffer, zigzag( state[1] ) )
+        self.buffer.append( state[2] )
+        self.flush()
+        self.file.close()
+        self.file = None
+
+"""
+    Journal
+
+    A journal read back into memory. events is a list of ( frame, kind, value ): kind is
+        JOURNAL_LEVEL with a seed for value, or None with an action code for value. end is the
+        recorded final state ( x, y, locked ), or None if the session did not end cleanly
+"""
+class Journal:
+    def __init__(self, idata):
+        if len( idata ) < JOURNAL_HEADER.size:
+            raise ValueError( "Truncated journal header" )
+        magic, version, world, self.width, self.fps = JOURNAL_HEADER.unpack_from( idata, 0 )
+        if magic != JOURNAL_MAGIC:
+            raise ValueError( "Not an input journal" )
+        if version != JOURNAL_VERSION:
+            raise ValueError( f"Unsupported journal version {version}" )
+        self.world = bool( world )
+        self.events = []
+        self.end = None
+
+        frame = 0
+        offset = JOURNAL_HEADER.size
+        try:
+            while offset < len( idata ):
+                tag = idata[ offset ]
+                delta, offset = unpack_varint( idata, offset + 1 )
+                frame += delta
+                if tag == JOURNAL_LEVEL:
+                    seed, offset = unpack_varint( idata, offset )
+                    self.events.append( ( frame, JOURNAL_LEVEL, seed ) )
+                elif tag == JOURNAL_END:
+                    x, offset = unpack_varint( idata, offset )
+                    y, offset = unpack_varint( idata, offset )
+                    self.end = ( unzigzag( x ), unzigzag( y ), bool( idata[ offset ] ) )
+                    break
+                else:
+                    self.events.append( ( frame, None, tag ) )
+        except IndexError:
+            # A session that crashed leaves a cut off record. Keep everything before it
+            logger.warning( "Journal is truncated after %d events", len( self.events ) )
+
+    @classmethod
+    def load( cls, path ):
+        with open( path, "rb" ) as file:
+            return cls( file.read() )
+
+    def matches( self, state ):
+        return self.end is None or tuple( state ) == self.end
+
+# Nearest-rank percentile of an already sorted list. Used by the benchmark and load generator reports
+def percentile( ordered, p ):
+    index = math.ceil( p / 100 * len( ordered ) ) - 1
+    return ordered[ min( max( index, 0 ), len( ordered ) - 1 ) ]
+
+"""
+    Frame Stats
+
+    Counts main loop iterations, rendered frames, and fixed updates, along with the time the loop
+        spent asleep, so the achieved frame rate and idle ratio can be reported
+"""
+class FrameStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.loops = 0
+        self.frames = 0
+        self.updates = 0
+        self.idle_time = 0.0
+
+    # Count one pass of the main loop. drawn is True if it renders a new frame
+    def frame( self, drawn ):
+        self.loops += 1
+        if drawn:
+            self.frames += 1
+
+    # Count seconds spent asleep
+    def idle( self, seconds ):
+        if seconds > 0:
+            self.idle_time += seconds
+
+    def elapsed( self ):
+        return max( time.perf_counter() - self.start, 1e-9 )
+
+    # Rendered frames per second
+    def fps( self ):
+        return self.frames / self.elapsed()
+
+    # Fraction of the time spent asleep
+    def idle_ratio( self ):
+        return min( self.idle_time / self.elapsed(), 1.0 )
+
+    def report( self ):
+        return ( f"{self.frames} frames in {self.elapsed():.1f}s ( {self.fps():.1f} fps ), "
+                 f"{self.loops / self.elapsed():.1f} loops/s, {self.updates} updates, {self.idle_ratio() * 100:.1f}% idle" )
+
+"""
+    Profiler
+
+    Per-phase frame timings for the Engine, kept in a ring buffer of the last capacity frames.
+        instrument() swaps timing wrappers in for the Engine's input, load, render, render_menu,
+        render_grid, and present methods on that one Engine object, and uninstrument() takes them
+        out again, so an Engine that is not being profiled runs exactly the code it would without
+        a profiler. Time spent in a wrapped method called by another wrapped method only counts
+        towards the inner one's phase.
+
+    A frame ends every time render() draws. Each frame records:
+        frame   -> time since the previous frame ended, including input handling and sleeping
+        input   -> handling input, not counting setup
+        setup   -> loading levels
+        map     -> drawing the tiles and the player
+        grid    -> drawing the grid lines ( full redraws only, incremental redraws count it as map )
+        menu    -> drawing the menu
+        display -> pygame.display.update
+"""
+class Profiler:
+    PHASES = ( "frame", "input", "setup", "map", "grid", "menu", "display" )
+
+    def __init__(self, icapacity=240):
+        self.capacity = icapacity
+        self.samples = { phase: array( "d", bytes( 8 * icapacity ) ) for phase in self.PHASES }
+        self.count = 0
+        self.current = dict.fromkeys( self.PHASES, 0.0 )
+        self.last_frame = time.perf_counter()
+        self.wrapped = []
+        # Seconds spent in nested wrapped calls, one entry per wrapped call that is running
+        self.nested = []
+
+    # Replace obj.name with a version that adds its run time, minus nested wrapped calls, to phase
+    def wrap( self, obj, name, phase ):
+        original = getattr( obj, name )
+        current = self.current
+        nested = self.nested
+        clock = time.perf_counter
+        def timed( *args, **kwargs ):
+            start = clock()
+            nested.append( 0.0 )
+            try:
+                return original( *args, **kwargs )
+            finally:
+                elapsed = clock() - start
+                current[ phase ] += elapsed - nested.pop()
+                if nested:
+                    nested[-1] += elapsed
+        setattr( obj, name, timed )
+        self.wrapped.append( ( obj, name ) )
+
+    # Every level and world goes through Engine.load, so it alone makes up the setup phase
+    def instrument( self, engine ):
+        for name, phase in ( ( "input", "input" ), ( "load", "setup" ), ( "render_menu", "menu" ),
+                             ( "render_grid", "grid" ), ( "present", "display" ), ( "render", "map" ) ):
+            self.wrap( engine, name, phase )
+
+        # End the frame after every render that draws
+        render = engine.render
+        def render_frame():
+            drawing = engine.new_frame
+            render()
+            if drawing:
+                self.end_frame()
+                engine.render_profile()
+        engine.render = render_frame
+        self.last_frame = time.perf_counter()
+
+    # Put back the Engine's own methods
+    def uninstrument( self ):
+        for obj, name in reversed( self.wrapped ):
+            if name in vars( obj ):
+                delattr( obj, name )
+        self.wrapped = []
+
+    def end_frame( self ):
+        now = time.perf_counter()
+        current = self.current
+        current["frame"] = now - self.last_frame
+        self.last_frame = now
+        index = self.count % self.capacity
+        for phase in self.PHASES:
+            self.samples[ phase ][ index ] = current[ phase ]
+            current[ phase ] = 0.0
+        self.count += 1
+
+    # The recorded frames, oldest first, as { phase: seconds } dictionaries
+    def recent( self ):
+        frames = min( self.count, self.capacity )
+        first = self.count - frames
+        return [
+            { phase: self.samples[ phase ][ i % self.capacity ] for phase in self.PHASES }
+            for i in range( first, self.count )
+        ]
+
+    # Return { phase: ( mean, max ) } in seconds over the recorded frames
+    def summary( self ):
+        frames = self.recent()
+        if not frames:
+            return {}
+        return {
+            phase: ( sum( frame[ phase ] for frame in frames ) / len( frames ), max( frame[ phase ] for frame in frames ) )
+            for phase in self.PHASES
+        }
+
+    def report( self ):
+        summary = self.summary()
+        if not summary:
+            return "No frames profiled"
+        return f"Last {min( self.count, self.capacity )} frames: " + ", ".join(
+            f"{phase} {mean * 1000:.2f} ms ( max {peak * 1000:.2f} )" for phase, ( mean, peak ) in summary.items()
+        )
+
+    # Write the recorded frames to path as JSON, times in seconds
+    def dump( self, path ):
+        with open( path, "w" ) as file:
+            json.dump( { "phases": list( self.PHASES ), "frames": self.recent() }, file )
+        logger.info( "Wrote %d profiled frames to %s", min( self.count, self.capacity ), path )
+
+"""
+    Fonts
+
+    Finding a system font by name makes pygame list every installed font, which can take longer
+        than the rest of startup. load_font() remembers the file it found ( or that there was none )
+        in FONT_CACHE, so later starts open the file directly. Fonts that are not installed fall
+        back to the font bundled with pygame
+"""
+FONT_CACHE = os.path.join(
+    os.environ.get( "XDG_CACHE_HOME" ) or os.path.join( os.path.expanduser( "~" ), ".cache" ), "maze_runner", "fonts.json"
+)
+
+def load_font( name, size ):
+    try:
+        with open( FONT_CACHE ) as file:
+            paths = json.load( file )
+    except ( OSError, ValueError ):
+        paths = {}
+
+    path = paths.get( name, "" )
+    # A cached path is only trusted while the file is still there. None means the font was not installed
+    if path == "" or ( path is not None and not os.path.exists( path ) ):
+        path = pygame.font.match_font( name )
+        paths[ name ] = path
+        try:
+            os.makedirs( os.path.dirname( FONT_CACHE ), exist_ok=True )
+            with open( FONT_CACHE, "w" ) as file:
+                json.dump( paths, file )
+        except OSError as error:
+            logger.debug( "Could not cache the font path: %s", error )
+        logger.debug( "Found font %s at %s", name, path )
+
+    # None loads the bundled font
+    return pygame.font.Font( path, size )
+
 """
     Game Engine Class
 
@@ -294,7 +2157,20 @@ class Board:
         the game-loop, loading assets, user input, and rendering
 """
 class Engine:
-    def __init__(self):
+    # seed picks the sequence of levels. The same seed always plays the same levels in the same order
+    # render_mode is "incremental" to redraw only what changed each frame, or "full" to redraw everything
+    # scheduler and fps pick how the main loop is paced, see Engine.run()
+    # world plays an endless ChunkedWorld instead of separate 61 by 61 levels
+    # record is a path to write a Journal of the session to
+    # fog is the player's sight radius in tiles to play with fog of war, or None to see the whole map
+    def __init__(self, seed=None, render_mode="incremental", scheduler="wait", fps=60, world=False, record=None, fog=None):
+        # How long each part of startup took, see Engine.startup_phase()
+        self.startup = {}
+        self.startup_start = self.startup_mark = time.perf_counter()
+        if load_pygame() is None:
+            raise RuntimeError( "The Engine needs PyGame. Use HeadlessRunner to play without a display" )
+        self.startup_phase( "import" )
+
         """
             Screen Settings
 
@@ -305,8 +2181,7 @@ class Engine:
         self.screen_width  = 900
         self.menu_height   = 125
         self.screen_height = ( self.screen_width + self.menu_height )
-        if enable_log:
-            log(f"Screen will be {self.screen_width} pixels by {self.screen_height} pixels", 0)
+        logger.debug( "Screen will be %d pixels by %d pixels", self.screen_width, self.screen_height )
 
         """
             Engine Settings
@@ -319,15 +2194,64 @@ class Engine:
         # Game starts in its exited state. Engine.setup() will start the game
         self.running = False
         # This is how many tiles wide and tall to make the game map
+        # In world mode the map is the window of chunks around the player, see ChunkedWorld
         self.map_width = 61
+        # Seeds for the worlds to play, and the current world, in world mode
+        self.world_seeds = None
+        self.world = None
+        if world:
+            self.world_seeds = random.Random( seed )
+            self.map_width = ChunkedWorld.window_width()
         # This is how many tiles the game will render to the screen at one time
         # Use an odd number to ensure the player will be rendered in the center of the screen
         self.viewscreen_options = [5,9,15,25,45]
         self.viewscreen_index = 1
         # Set to false. First fram will be rendered during Engine.setup()
         self.new_frame = False
-        if enable_log:
-            log(f"Board will be {self.map_width} tiles square and the viewscreen will be {self.viewscreen_options[self.viewscreen_index]} tiles square", 0)
+        # How to render each frame, see Engine.render()
+        self.render_mode = render_mode
+        # How to pace the main loop, and the most frames ( and fixed updates ) to run per second
+        self.scheduler = scheduler
+        self.fps = fps
+        # Input events waiting for the next fixed update, only used by the "fixed" scheduler
+        self.queued_events = []
+        # Frame rate and idle time of the main loop
+        self.stats = FrameStats()
+        # What the last frame showed. Incremental rendering falls back to a full redraw while this is None
+        self.last_view = None
+        # Off-screen copy of the map with one pixel per tile, see Engine.update_map_surface()
+        self.map_surface = None
+        self.map_surface_version = None
+        # Transparent surface holding the grid lines for the current tile width, see Engine.grid_overlay()
+        self.grid_surface = None
+        self.grid_surface_width = None
+        # Pre-rendered menu for each objective, see Engine.build_hud()
+        self.hud_surfaces = None
+        # Journal being written, and whether a journal is being played back, see Engine.replay()
+        self.journal = None
+        self.replaying = False
+        # Frame timings, only kept while profiling, and the path to dump them to on exit. See Profiler
+        self.profiler = None
+        self.profile_dump = None
+        # Cached text of the profiler overlay, and the frame it was made on
+        self.profile_text = None
+        self.profile_text_frame = None
+        # Click to travel and auto-explore, see Engine.advance_travel()
+        #   travel_rate : tiles walked per second
+        #   travel_fps  : frames drawn per second while walking. Steps due in between are batched
+        self.travel = deque()
+        self.exploring = False
+        self.travel_rate = 40
+        self.travel_fps = 20
+        self.travel_start = 0.0
+        self.travel_done = 0
+        self.travel_next_frame = 0.0
+        # Key-repeat for held movement keys, see Engine.input()
+        self.repeat_delay = 0.25
+        self.repeat_rate = 15
+        # Held keys and when they next repeat
+        self.held_keys = {}
+        logger.debug( "Board will be %d tiles square and the viewscreen will be %d tiles square", self.map_width, self.viewscreen_options[self.viewscreen_index] )
 
         """
             Map Settings
@@ -341,24 +2265,56 @@ class Engine:
         self.tile_width = int( self.screen_width / self.viewscreen_options[self.viewscreen_index] )
         # Define board
         self.board = Board( self.map_width )
-        if enable_log:
-            log(f"Each tile will be {self.tile_width} pixels square", 0)
+        # Colors to draw each display code with, see Engine.display_code()
+        self.palette = self.board.tile_colors
+        # Shortest paths for travel. Its distance fields stay cached until a new level is loaded
+        self.paths = PathFinder( self.board )
+        if fog is not None:
+            self.board.fov = FieldOfView( self.board, fog )
+            # Unseen tiles are black, remembered tiles are dimmed, visible tiles are drawn as usual
+            self.palette = [ ( 0, 0, 0 ) ] * 24
+            for code, color in enumerate( self.board.tile_colors ):
+                self.palette[ FieldOfView.SHADE_REMEMBERED + code ] = tuple( int( c * 0.35 ) for c in color )
+                self.palette[ FieldOfView.SHADE_VISIBLE + code ] = color
+        # Levels are built ahead of time on a background thread, see Engine.setup()
+        self.levels = None
+        if self.world_seeds is None:
+            self.levels = LevelPregenerator( self.map_width, self.board.generator, seed )
+            self.levels.start()
+        logger.debug( "Each tile will be %d pixels square", self.tile_width )
 
         """
             Pygame Settings
             
             Setup rendering pipeline
         """
-        # Start pygame functionality
-        pygame.init()
+        self.startup_phase( "engine" )
+        # Start only the parts of pygame the game uses. pygame.init() would also start audio and joysticks
+        pygame.display.init()
+        pygame.font.init()
         # Define a pygame display object
         self.display = pygame.display.set_mode( ( self.screen_width, self.screen_height ) )
         # Set window title
         pygame.display.set_caption( "Maze Runner" )
+        self.startup_phase( "display" )
         # Set display font
-        self.font = pygame.font.SysFont("Courier New", 16)
-        if enable_log:
-            log(f"PyGame initialized", 0)
+        self.font = load_font( "Courier New", 16 )
+        self.startup_phase( "font" )
+        logger.info( "PyGame initialized" )
+
+        # Keys and the actions they trigger
+        self.key_actions = {
+            pygame.K_q: ACTION_ZOOM_IN,    pygame.K_e: ACTION_ZOOM_OUT,
+            pygame.K_RIGHT: ACTION_RIGHT,  pygame.K_d: ACTION_RIGHT,
+            pygame.K_LEFT: ACTION_LEFT,    pygame.K_a: ACTION_LEFT,
+            pygame.K_UP: ACTION_UP,        pygame.K_w: ACTION_UP,
+            pygame.K_DOWN: ACTION_DOWN,    pygame.K_s: ACTION_DOWN,
+            pygame.K_SPACE: ACTION_INTERACT,
+            pygame.K_r: ACTION_NEW_LEVEL,
+        }
+
+        if record is not None:
+            self.journal = JournalWriter( record, self.map_width, fps, world )
 
     """
         Game Loop Functions
@@ -366,175 +2322,382 @@ class Engine:
     # This function will be called once before the game starts, and then once again each time
     #   a new level is requested
     def setup( self ):
-        if enable_log:
-            log(f"Generating a new level...", 0)
+        logger.debug( "Generating a new level..." )
+
+        if self.world_seeds is not None:
+            # Start a new world around chunk [ 0, 0 ]
+            self.load( self.world_seeds.getrandbits( 32 ) )
+        else:
+            # Swap in the next level. It has normally been generated in the background already
+            self.load( self.levels.next_seed() )
 
-        # Clear the board
-        self.board.board_clear()
+        # Start the game engine
+        self.running = True
 
-        # Generate a new level
-        self.board.new_level()
+    # Load the level ( or world ) for seed, outside of the usual sequence
+    def load( self, seed ):
+        if self.world_seeds is not None:
+            self.world = ChunkedWorld( seed )
+            self.world.attach( self.board )
+        else:
+            self.board.load_level( self.levels.level( seed ) )
+        self.level_loaded()
+
+    def level_loaded( self ):
+        if "level" not in self.startup:
+            self.startup_phase( "level" )
+        if self.world is not None:
+            logger.info( "Entered world with seed %d", self.board.seed )
+        else:
+            logger.info( "Loaded level with seed %d", self.board.seed )
+        if self.journal is not None:
+            self.journal.level( self.frame_number(), self.board.seed )
 
         # Render new frame
         self.new_frame = True
 
-        # Start the game engine
-        self.running = True
+    # Number of 1 / fps second ticks since the game loop started. Journals time actions with it
+    def frame_number( self ):
+        if self.scheduler == "fixed":
+            return self.stats.updates
+        return int( ( time.perf_counter() - self.stats.start ) * self.fps )
+
+    # Player position ( in world tiles in world mode ) and door state, to compare with the end of a journal
+    def state( self ):
+        if self.world is not None:
+            self.world.detach( self.board )
+            return ( *self.world.player, self.world.locked )
+        return ( self.board.player.x, self.board.player.y, self.board.door.locked )
 
     # This function will be called each frame, and will parse user input
-    def input( self ):
+    # events defaults to everything in the pygame event queue
+    """
+        Input
+
+        input() turns the raw event queue into a list of actions, adds key-repeat for held movement
+            keys, and then applies every action of the frame in one go, so a burst of events costs
+            one frame. A frame is only drawn if one of the actions actually changed something:
+            bumping into a wall or zooming past the last zoom level draws nothing.
+
+        Held movement keys repeat repeat_delay seconds after they are pressed, then repeat_rate
+            times a second. Repeats are generated from the clock rather than by SDL, so they are
+            paced by the main loop like everything else. A repeat_rate of 0 turns key-repeat off
+    """
+    def input( self, events=None ):
+        if events is None:
+            events = pygame.event.get()
+        actions = []
         # Get keyboard events, one at a time
-        for event in pygame.event.get():
+        for event in events:
             # If the user clicks the close button
             if event.type == pygame.QUIT:
-                if enable_log:
-                    log(f"Exiting the game", 1)
+                logger.info( "Exiting the game" )
                 # Stop the game engine
                 self.running = False
+            # Left click on the map walks there
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                self.click( *event.pos )
+            # Keys stop repeating when they are let go, or when the window loses focus
+            elif event.type == pygame.KEYUP:
+                self.held_keys.pop( event.key, None )
+            elif event.type == pygame.WINDOWFOCUSLOST:
+                self.held_keys.clear()
             # If player pressed a key
             elif event.type == pygame.KEYDOWN:
-                # Render new frame any time the user presses a key
-                self.new_frame = True
+                # Any key takes back control from travel
+                if self.travel or self.exploring:
+                    self.stop_travel()
+                    self.new_frame = True
+                    if event.key == pygame.K_x:
+                        continue
                 # If the ESC key was pressed
                 if event.key == pygame.K_ESCAPE:
-                    if enable_log:
-                        log(f"Exiting the game", 1)
+                    logger.info( "Exiting the game" )
                     # End game
                     self.running = False
-                elif event.key == pygame.K_q:
-                    if self.viewscreen_index > 0:
-                        self.viewscreen_index -= 1
-                        self.tile_width = int( self.screen_width / self.viewscreen_options[self.viewscreen_index] )
-                        if enable_log:
-                            log(f"Viewport width {self.viewscreen_options[self.viewscreen_index]} | Tile Width {self.tile_width}", 0)
-                elif event.key == pygame.K_e:
-                    if self.viewscreen_index < len(self.viewscreen_options) - 1:
-                        self.viewscreen_index += 1
-                        self.tile_width = int( self.screen_width / self.viewscreen_options[self.viewscreen_index] )
-                        if enable_log:
-                            log(f"Viewport width {self.viewscreen_options[self.viewscreen_index]} | Tile Width {self.tile_width}", 0)
-                elif event.key == pygame.K_RIGHT or event.key == pygame.K_d:
-                    self.board.move( 1, 0 )
-                elif event.key == pygame.K_LEFT or event.key == pygame.K_a:
-                    self.board.move( -1, 0 )
-                elif event.key == pygame.K_UP or event.key == pygame.K_w:
-                    self.board.move( 0, -1 )
-                elif event.key == pygame.K_DOWN or event.key == pygame.K_s:
-                    self.board.move( 0, 1 )
-                elif event.key == pygame.K_SPACE:
-                    if self.board.player_interaction():
-                        self.setup()
-                elif event.key == pygame.K_r:
-                    self.setup()
+                elif event.key == pygame.K_F3:
+                    self.toggle_profiler()
+                elif event.key == pygame.K_F4 and self.profiler is not None:
+                    self.profiler.dump( time.strftime( "maze_profile_%Y%m%d_%H%M%S.json" ) )
+                elif event.key == pygame.K_x:
+                    self.exploring = True
+                    self.plan_explore()
+                elif event.key in self.key_actions:
+                    action = self.key_actions[ event.key ]
+                    actions.append( action )
+                    if action in MOVES and self.repeat_rate > 0:
+                        self.held_keys[ event.key ] = time.perf_counter() + self.repeat_delay
+
+        actions.extend( self.key_repeats() )
+
+        changed = False
+        for action in actions:
+            changed = self.apply( action ) or changed
+        if changed:
+            self.new_frame = True
+
+    # Actions for the held keys that are due to repeat
+    def key_repeats( self ):
+        if not self.held_keys:
+            return []
+        now = time.perf_counter()
+        interval = 1 / self.repeat_rate
+        actions = []
+        for key, due in self.held_keys.items():
+            if now < due:
+                continue
+            # After a stall, catch up by a few steps at most instead of jumping across the map
+            count = min( int( ( now - due ) / interval ) + 1, 4 )
+            actions.extend( [ self.key_actions[ key ] ] * count )
+            self.held_keys[ key ] = max( due + count * interval, now - interval )
+        return actions
+
+    # Milliseconds until the next key repeat, or None if no key is held
+    def repeat_timeout( self ):
+        if not self.held_keys:
+            return None
+        return max( int( ( min( self.held_keys.values() ) - time.perf_counter() ) * 1000 ), 1 )
+
+    # Apply one ACTION_* code, recording it if a journal is being written
+    # Returns True if it changed anything that is drawn
+    def apply( self, action ):
+        if self.journal is not None:
+            self.journal.action( self.frame_number(), action )
+        board = self.board
+        before = ( board.player.x, board.player.y, board.door.locked, board.map_version, self.viewscreen_index )
+
+        if action == ACTION_ZOOM_IN:
+            if self.viewscreen_index > 0:
+                self.viewscreen_index -= 1
+                self.tile_width = int( self.screen_width / self.viewscreen_options[self.viewscreen_index] )
+                logger.debug( "Viewport width %d | Tile Width %d", self.viewscreen_options[self.viewscreen_index], self.tile_width )
+        elif action == ACTION_ZOOM_OUT:
+            if self.viewscreen_index < len(self.viewscreen_options) - 1:
+                self.viewscreen_index += 1
+                self.tile_width = int( self.screen_width / self.viewscreen_options[self.viewscreen_index] )
+                logger.debug( "Viewport width %d | Tile Width %d", self.viewscreen_options[self.viewscreen_index], self.tile_width )
+        elif action in MOVES:
+            self.board.move( *MOVES[ action ] )
+            # Keep the player inside the middle of the world window
+            if self.world is not None:
+                self.world.follow( self.board )
+        elif action == ACTION_INTERACT:
+            # While replaying, the journal loads the next level itself
+            if self.board.player_interaction() and not self.replaying:
+                self.setup()
+        elif action == ACTION_NEW_LEVEL:
+            if not self.replaying:
+                self.setup()
+
+        board = self.board
+        return before != ( board.player.x, board.player.y, board.door.locked, board.map_version, self.viewscreen_index )
 
-    def render_menu( self ):
-        text = self.font.render( "+-----------------Controls-----------------+", True, (0, 0, 0) )
-        text_rect = text.get_rect()
-        text_rect.x = 5
-        text_rect.y = self.screen_height - self.menu_height + 2
-        self.display.blit( text, text_rect )
-
-        text = self.font.render( "| [ q: Zoom    In   ] [ e: Zoom      Out ] |", True, (0, 0, 0) )
-        text_rect = text.get_rect()
-        text_rect.x = 5
-        text_rect.y = self.screen_height - self.menu_height + 22
-        self.display.blit( text, text_rect )
-
-        text = self.font.render( "| [ w: Move    Up   ] [ s: Move     Down ] |", True, (0, 0, 0) )
-        text_rect = text.get_rect()
-        text_rect.x = 5
-        text_rect.y = self.screen_height - self.menu_height + 42
-        self.display.blit( text, text_rect )
-
-        text = self.font.render( "| [ a: Move    Left ] [ d: Move    Right ] |", True, (0, 0, 0) )
-        text_rect = text.get_rect()
-        text_rect.x = 5
-        text_rect.y = self.screen_height - self.menu_height + 62
-        self.display.blit( text, text_rect )
-
-        text = self.font.render( "| [ Space: Interact ] [ r: New     Level ] |", True, (0, 0, 0) )
-        text_rect = text.get_rect()
-        text_rect.x = 5
-        text_rect.y = self.screen_height - self.menu_height + 82
-        self.display.blit( text, text_rect )
-
-        text = self.font.render( "+------------------------------------------+", True, (0, 0, 0) )
-        text_rect = text.get_rect()
-        text_rect.x = 5
-        text_rect.y = self.screen_height - self.menu_height + 102
-        self.display.blit( text, text_rect )
-
-        text = self.font.render( "+------------Current  Objective------------+", True, (0, 0, 0) )
-        text_rect = text.get_rect()
-        text_rect.x = self.screen_width - text_rect.width - 5
-        text_rect.y = self.screen_height - self.menu_height + 2
-        self.display.blit( text, text_rect )
-
-        if self.board.door.locked:
-            text = self.font.render(     "|               Find the key               |", True, (0, 0, 0) )
-        else:
-            text = self.font.render(     "|             Find the Way Out             |", True, (0, 0, 0) )
-        text_rect = text.get_rect()
-        text_rect.x = self.screen_width - text_rect.width - 5
-        text_rect.y = self.screen_height - self.menu_height + 22
-        self.display.blit( text, text_rect )
-
-        text = self.font.render( "|                                          |", True, (0, 0, 0) )
-        text_rect = text.get_rect()
-        text_rect.x = self.screen_width - text_rect.width - 5
-        text_rect.y = self.screen_height - self.menu_height + 42
-        self.display.blit( text, text_rect )
-
-        text = self.font.render( "|                                          |", True, (0, 0, 0) )
-        text_rect = text.get_rect()
-        text_rect.x = self.screen_width - text_rect.width - 5
-        text_rect.y = self.screen_height - self.menu_height + 62
-        self.display.blit( text, text_rect )
-
-        text = self.font.render( "|                                          |", True, (0, 0, 0) )
-        text_rect = text.get_rect()
-        text_rect.x = self.screen_width - text_rect.width - 5
-        text_rect.y = self.screen_height - self.menu_height + 82
-        self.display.blit( text, text_rect )
-
-        text = self.font.render( "+------------------------------------------+", True, (0, 0, 0) )
-        text_rect = text.get_rect()
-        text_rect.x = self.screen_width - text_rect.width - 5
-        text_rect.y = self.screen_height - self.menu_height + 102
-        self.display.blit( text, text_rect )
-
-        cell_rect = pygame.Rect(
-            text_rect.x + int( text_rect.w / 2 ) - 5 - 30,
-            self.screen_height - 80,
-            60, 60
-        )
-        if self.board.door.locked:
-            pygame.draw.rect( self.display, self.board.colors["KEY"], cell_rect )
-        else:
-            pygame.draw.rect( self.display, self.board.colors["UNLOCKED"], cell_rect )
+    """
+        Travel
 
-    # Render the tiles in current viewscreen
-    def render( self ):
-        # Only render new frame when a change has been made to game state
-        if not self.new_frame:
+        Clicking a map tile walks the player there along the shortest path, and x starts
+            auto-explore: walk to the nearest tile next to unexplored ground ( with fog of war ), or
+            to the key and then the door once they are known, interacting when they are reached.
+            Paths come from self.paths, whose distance fields are cached until the level changes.
+
+        Steps are taken travel_rate times a second, but the main loop only takes them travel_fps
+            times a second, applying every step that came due since the last time in one batch and
+            drawing one frame for the lot. Every step goes through apply(), so journals record it
+    """
+    # Actions that walk along a path of tiles
+    @staticmethod
+    def path_actions( path ):
+        steps = { ( 1, 0 ): ACTION_RIGHT, ( -1, 0 ): ACTION_LEFT, ( 0, -1 ): ACTION_UP, ( 0, 1 ): ACTION_DOWN }
+        return [ steps[ ( x1 - x0, y1 - y0 ) ] for ( x0, y0 ), ( x1, y1 ) in zip( path, path[1:] ) ]
+
+    def start_travel( self, actions ):
+        self.travel = deque( actions )
+        self.travel_start = time.perf_counter()
+        self.travel_done = 0
+        self.travel_next_frame = self.travel_start
+
+    def stop_travel( self ):
+        self.travel.clear()
+        self.exploring = False
+
+    # Walk to the tile under window pixel [ mx, my ]
+    def click( self, mx, my ):
+        vs_width = self.viewscreen_options[self.viewscreen_index]
+        if not ( 0 <= mx < vs_width * self.tile_width and 0 <= my < vs_width * self.tile_width ):
+            return
+        sx, sy = self.viewscreen_origin()
+        x = sx + mx // self.tile_width
+        y = sy + my // self.tile_width
+        fov = self.board.fov
+        if fov is not None and not fov.is_explored( x, y ):
             return
+        self.stop_travel()
+        # Walk down the player's distance field from the target, then turn the path around
+        path = self.paths.path( x, y, self.board.player.x, self.board.player.y )
+        if path is not None:
+            self.start_travel( self.path_actions( path[ ::-1 ] ) )
+
+    # Queue the next leg of auto-explore, or stop exploring if there is nowhere left to go
+    def plan_explore( self ):
+        board = self.board
+        fov = board.fov
+        px, py = board.player.x, board.player.y
+
+        # The next objective, if it is on the map and has been seen
+        # In world mode it can be chunks away, outside the window the board holds
+        objective = ( board.key.x, board.key.y ) if board.door.locked else ( board.door.x, board.door.y )
+        on_map = 0 <= objective[0] < board.width and 0 <= objective[1] < board.width
+        if on_map and ( fov is None or fov.is_explored( *objective ) ):
+            path = self.paths.path( objective[0], objective[1], px, py )
+            if path is not None:
+                self.start_travel( self.path_actions( path[ ::-1 ] ) + [ ACTION_INTERACT ] )
+                return
+
+        # Otherwise the nearest explored tile that has unexplored ground next to it
+        target = None
+        if fov is None and not on_map:
+            # Nothing is unexplored without fog, so head for the reachable tile closest to the
+            #   objective. The window follows the player until the objective is on the map
+            field = self.paths.field( px, py )
+            height = board.board.height
+            best = None
+            for i, distance in enumerate( field ):
+                if distance <= 0:
+                    continue
+                x, y = divmod( i, height )
+                score = abs( x - objective[0] ) + abs( y - objective[1] )
+                if best is None or score < best:
+                    best = score
+                    target = ( x, y )
+        elif fov is not None:
+            # A world never runs out of unexplored ground, so there the frontier tile closest to the
+            #   objective is picked instead of the one closest to the player, or exploring could
+            #   wander forever. Ties go to the tile closest to the player
+            toward = self.world is not None
+            field = self.paths.field( px, py )
+            height = board.board.height
+            best = None
+            for x in range( board.width ):
+                for y in range( height ):
+                    distance = field[ x * height + y ]
+                    if distance <= 0:
+                        continue
+                    score = ( abs( x - objective[0] ) + abs( y - objective[1] ), distance ) if toward else distance
+                    if ( best is not None and score >= best ) or not fov.is_explored( x, y ):
+                        continue
+                    for nx, ny in ( ( x + 1, y ), ( x - 1, y ), ( x, y + 1 ), ( x, y - 1 ) ):
+                        if 0 <= nx < board.width and 0 <= ny < height and not fov.is_explored( nx, ny ):
+                            best = score
+                            target = ( x, y )
+                            break
+        if target is None:
+            logger.info( "Nothing left to explore" )
+            self.stop_travel()
+            return
+        self.start_travel( self.path_actions( self.paths.path( target[0], target[1], px, py )[ ::-1 ] ) )
 
-        # Clear new frame flag
-        self.new_frame = False
+    # Take every travel step that is due, at most travel_fps times a second
+    def advance_travel( self ):
+        if not self.travel:
+            if self.exploring:
+                self.plan_explore()
+            return
+        now = time.perf_counter()
+        if now < self.travel_next_frame:
+            return
+        self.travel_next_frame = now + 1 / self.travel_fps
+
+        due = int( ( now - self.travel_start ) * self.travel_rate ) + 1 - self.travel_done
+        version = self.board.map_version
+        while due > 0 and self.travel:
+            self.apply( self.travel.popleft() )
+            self.travel_done += 1
+            due -= 1
+            # A new level ends the walk
+            if self.board.map_version != version:
+                self.travel.clear()
+                break
+        self.new_frame = True
 
-        if enable_log:
-            log(f"Rendering new frame...", 0)
+    # Milliseconds until advance_travel has steps to take, or None if not traveling
+    def travel_timeout( self ):
+        if not self.travel and not self.exploring:
+            return None
+        return max( int( ( self.travel_next_frame - time.perf_counter() ) * 1000 ), 1 )
 
+    """
+        HUD
 
-        # Clear previous frame
-        self.display.fill( (255, 255, 255) )
+        The menu is rasterized once into two surfaces, one for each objective ( door locked and door
+            unlocked ), so drawing it is a single blit. The surfaces cover the menu area below the top
+            row of pixels, which the bottom grid line is drawn on
+    """
+    def build_hud( self ):
+        top = self.screen_height - self.menu_height + 1
+        panel = pygame.Surface( ( self.screen_width, self.menu_height - 1 ) )
+        panel.fill( (255, 255, 255) )
+
+        # Static control panel on the left, objective frame on the right
+        left = [
+            "+-----------------Controls-----------------+",
+            "| [ q: Zoom    In   ] [ e: Zoom      Out ] |",
+            "| [ w: Move    Up   ] [ s: Move     Down ] |",
+            "| [ a: Move    Left ] [ d: Move    Right ] |",
+            "| [ Space: Interact ] [ r: New     Level ] |",
+            "+------------------------------------------+",
+        ]
+        right = {
+            0: "+------------Current  Objective------------+",
+            2: "|                                          |",
+            3: "|                                          |",
+            4: "|                                          |",
+            5: "+------------------------------------------+",
+        }
+        for line, message in enumerate( left ):
+            panel.blit( self.font.render( message, True, (0, 0, 0) ), ( 5, line * 20 + 1 ) )
+        for line, message in right.items():
+            text = self.font.render( message, True, (0, 0, 0) )
+            text_rect = text.get_rect()
+            text_rect.x = self.screen_width - text_rect.width - 5
+            text_rect.y = line * 20 + 1
+            panel.blit( text, text_rect )
+
+        # One copy of the panel per objective, with the objective line and its colored square
+        self.hud_surfaces = {}
+        for locked in ( True, False ):
+            surface = panel.copy()
+            if locked:
+                text = self.font.render(     "|               Find the key               |", True, (0, 0, 0) )
+            else:
+                text = self.font.render(     "|             Find the Way Out             |", True, (0, 0, 0) )
+            obj_rect = text.get_rect()
+            obj_rect.x = self.screen_width - obj_rect.width - 5
+            obj_rect.y = 21
+            surface.blit( text, obj_rect )
+
+            cell_rect = pygame.Rect(
+                text_rect.x + int( text_rect.w / 2 ) - 5 - 30,
+                self.screen_height - 80 - top,
+                60, 60
+            )
+            pygame.draw.rect( surface, self.board.colors[ "KEY" if locked else "UNLOCKED" ], cell_rect )
+            self.hud_surfaces[ locked ] = surface
+
+    # Draw the menu for the current objective and return the rect it covers
+    def render_menu( self ):
+        if self.hud_surfaces is None:
+            self.build_hud()
+        return self.display.blit( self.hud_surfaces[ self.board.door.locked ], ( 0, self.screen_height - self.menu_height + 1 ) )
 
-        """
-            Calculate Viewscreen Offset
-            
-            If the player is away from the walls of the map, render player in the middle of the viewscreen
-            Otherwise, lock viewscreen to bounds of the map and calculate where the player should be rendered
-        """
+    """
+        Calculate Viewscreen Offset
+
+        If the player is away from the walls of the map, render player in the middle of the viewscreen
+        Otherwise, lock viewscreen to bounds of the map and calculate where the player should be rendered
+
+        Returns the coordinates ( sx, sy ) of the top left viewscreen tile
+    """
+    def viewscreen_origin( self ):
         vs_offset = int( self.viewscreen_options[self.viewscreen_index] / 2 )
         sx = 0  # x coordinate of top left viewscreen tile
         sy = 0  # y coordinate of top left viewscreen tile
@@ -566,27 +2729,55 @@ class Engine:
             # The viewscreen will render the player in the center of the viewscreen
             sy = self.board.player.y - vs_offset
 
-        if enable_log:
-            log(f"The viewscreen will render map tiles [ {sx}, {sy} ] -> [ {sx + self.viewscreen_options[self.viewscreen_index] - 1}, {sy + self.viewscreen_options[self.viewscreen_index] - 1} ] ", 0)
-
-        # Render board
-        cell_rect = pygame.Rect( 0, 0, self.tile_width, self.tile_width )
-        for x in range( self.viewscreen_options[self.viewscreen_index] ):
-            cell_rect.x = x * cell_rect.width
-            for y in range( self.viewscreen_options[self.viewscreen_index] ):
-                cell_rect.y = y * cell_rect.width
-                # Get cell type
-                cell_type = self.board.board[sx+x][sy+y]
-                # Check for door
-                if cell_type == "DOOR":
-                    if self.board.door.locked:
-                        pygame.draw.rect( self.display, self.board.colors["LOCKED"], cell_rect )
-                    else:
-                        pygame.draw.rect( self.display, self.board.colors["UNLOCKED"], cell_rect )
-                else:
-                    pygame.draw.rect( self.display, self.board.colors[cell_type], cell_rect )
+        return sx, sy
 
-        # Render on top of map
+    """
+        Map Surface
+
+        An off-screen 8-bit surface with one pixel per map tile, using the tile colors as its palette.
+            It is rebuilt when a new level is loaded and patched one pixel at a time for the tiles in
+            Board.changed_tiles, so it must be updated before a renderer clears that list
+    """
+    def update_map_surface( self ):
+        grid = self.board.board
+        if self.map_surface_version != self.board.map_version:
+            # The surface wants rows of pixels, the grid stores columns of tiles
+            array = grid.large_array()
+            if array is not None:
+                self.map_pixels = bytearray( array.T.tobytes() )
+            else:
+                self.map_pixels = bytearray( b"".join( grid.cells[ y :: grid.height ] for y in range( grid.height ) ) )
+            fov = self.board.fov
+            if fov is not None:
+                # Add every tile's shade to its code, in the same row order
+                width = grid.width
+                shades = bytearray( len( self.map_pixels ) )
+                for x in range( width ):
+                    column = fov.explored[ x * fov.column_bytes : ( x + 1 ) * fov.column_bytes ]
+                    for y in range( grid.height ):
+                        if column[ y >> 3 ] >> ( y & 7 ) & 1:
+                            shades[ y * width + x ] = FieldOfView.SHADE_REMEMBERED
+                for x, y in fov.visible:
+                    shades[ y * width + x ] = FieldOfView.SHADE_VISIBLE
+                self.map_pixels = bytearray( map( int.__add__, self.map_pixels, shades ) )
+            self.map_surface = pygame.image.frombuffer( self.map_pixels, ( grid.width, grid.height ), "P" )
+            self.map_surface.set_palette( self.palette )
+            self.map_surface_version = self.board.map_version
+            return
+
+        # Pixel values are palette indices, which are the display codes
+        for x, y in self.board.changed_tiles:
+            self.map_surface.set_at( ( x, y ), self.display_code( x, y ) )
+
+    # Palette index of tile [ x, y ]: its tile code, plus its shade when playing with fog of war
+    def display_code( self, x, y ):
+        code = self.board.board.get( x, y )
+        if self.board.fov is not None:
+            code += self.board.fov.shade( x, y )
+        return code
+
+    # Draw the player on top of the map. sx and sy are the top left viewscreen tile
+    def render_player( self, sx, sy ):
         # calculate center of player cell in relation to viewscreen
         px = ( ( self.board.player.x - sx ) * self.tile_width ) + int( 0.5 * self.tile_width )
         py = ( ( self.board.player.y - sy ) * self.tile_width ) + int( 0.5 * self.tile_width )
@@ -594,43 +2785,453 @@ class Engine:
         r = int( 0.75 * self.tile_width / 2 )
         pygame.draw.circle( self.display, self.board.player.color, (px, py), r )
 
+    """
+        Grid Overlay
+
+        The grid lines for the current zoom level, drawn once onto a transparent surface and reused
+            every frame. One line is drawn per row and column boundary. The surface is thrown away and
+            redrawn whenever tile_width changes
+    """
+    def grid_overlay( self ):
+        if self.grid_surface_width != self.tile_width:
+            vs_width = self.viewscreen_options[self.viewscreen_index]
+            size = vs_width * self.tile_width
+            # One pixel taller than the viewscreen so the bottom line is included
+            self.grid_surface = pygame.Surface( ( self.screen_width, size + 1 ), pygame.SRCALPHA )
+            # Horizontal lines on every row boundary, starting one pixel in from the left side
+            for y in range( vs_width + 1 ):
+                pygame.draw.line( self.grid_surface, ( 25, 25, 25 ), ( 1, y * self.tile_width ), ( self.screen_width, y * self.tile_width ), 1 )
+            # Vertical lines on every column boundary except the left side of the window
+            for x in range( 1, vs_width ):
+                pygame.draw.line( self.grid_surface, ( 25, 25, 25 ), ( x * self.tile_width, 0 ), ( x * self.tile_width, size ), 1 )
+            self.grid_surface_width = self.tile_width
+        return self.grid_surface
+
+    # Redraw one tile at viewscreen location [ vx, vy ], including its part of the grid, and return its rect
+    def render_tile( self, vx, vy, code ):
+        cell_rect = pygame.Rect( vx * self.tile_width, vy * self.tile_width, self.tile_width, self.tile_width )
+        self.display.fill( self.palette[ code ], cell_rect )
+        self.display.blit( self.grid_overlay(), cell_rect, cell_rect )
+        return cell_rect
+
+    # Render the tiles in current viewscreen
+    def render( self ):
+        # Only render new frame when a change has been made to game state
+        if not self.new_frame:
+            return
+
+        # Clear new frame flag
+        self.new_frame = False
+
+        logger.debug( "Rendering new frame..." )
+
+        sx, sy = self.viewscreen_origin()
+        self.update_map_surface()
+
+        logger.debug( "The viewscreen will render map tiles [ %d, %d ] -> [ %d, %d ]", sx, sy, sx + self.viewscreen_options[self.viewscreen_index] - 1, sy + self.viewscreen_options[self.viewscreen_index] - 1 )
+
+        if self.render_mode != "incremental" or not self.render_incremental( sx, sy ):
+            self.render_full( sx, sy )
+
+        # Remember what this frame showed
+        self.last_view = (
+            sx, sy, self.viewscreen_index, self.board.map_version,
+            self.board.player.x, self.board.player.y, self.board.door.locked
+        )
+
+        if "first frame" not in self.startup:
+            self.startup_phase( "first frame" )
+            logger.info( "%s", self.startup_report() )
+
+    """
+        Startup Timing
+
+        startup_phase( name ) records the time since the previous phase ended. The phases are:
+            import      -> importing pygame
+            engine      -> the board, path finder and level pregenerator
+            display     -> starting the display and font modules and opening the window
+            font        -> finding and loading the menu font
+            level       -> until the first level ( or world ) is loaded
+            first frame -> drawing the first frame
+    """
+    def startup_phase( self, name ):
+        now = time.perf_counter()
+        self.startup[ name ] = now - self.startup_mark
+        self.startup_mark = now
+
+    def startup_report( self ):
+        phases = ", ".join( f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.startup.items() )
+        return f"Startup took {( self.startup_mark - self.startup_start ) * 1000:.1f} ms: {phases}"
+
+    # Redraw the whole window
+    def render_full( self, sx, sy ):
+        # Clear previous frame
+        self.display.fill( (255, 255, 255) )
+        # Tiles changed by gameplay are redrawn below anyway
+        self.board.changed_tiles.clear()
+
+        # Render board by scaling the viewscreen's part of the map surface up to the screen in one blit
+        vs_width = self.viewscreen_options[self.viewscreen_index]
+        view = self.map_surface.subsurface( ( sx, sy, vs_width, vs_width ) )
+        self.display.blit( pygame.transform.scale( view, ( vs_width * self.tile_width, vs_width * self.tile_width ) ), ( 0, 0 ) )
+
+        # Render on top of map
+        self.render_player( sx, sy )
+
         # Draw grid
-        for x in range( 1, self.viewscreen_options[self.viewscreen_index] ):
-            for y in range( self.viewscreen_options[self.viewscreen_index] + 1 ):
-                pygame.draw.line( self.display, ( 25, 25, 25 ), ( x, y * self.tile_width ), ( self.screen_width, y * self.tile_width ), 1 )
-                pygame.draw.line( self.display, ( 25, 25, 25 ), ( x * self.tile_width, y ), ( x * self.tile_width, self.screen_width ), 1 )
+        self.render_grid()
 
         # Render Menu
         self.render_menu()
 
         # Push new frame to display
-        pygame.display.update()
+        self.present()
+
+    def render_grid( self ):
+        self.display.blit( self.grid_overlay(), ( 0, 0 ) )
+
+    # Push rects ( or the whole window ) to the display
+    def present( self, rects=None ):
+        if rects is None:
+            pygame.display.update()
+        else:
+            pygame.display.update( rects )
+
+    """
+        Incremental Rendering
+
+        Redraw only what changed since the last frame: the tiles in Board.changed_tiles, the player's
+            old and new tile, and the menu if the objective changed. If the viewscreen moved, the
+            pixels already on screen are scrolled and only the newly exposed tiles are drawn.
+            Only the changed rects are pushed to the display
+
+        Returns False if a full redraw is needed instead ( first frame, zoom change, new level )
+    """
+    def render_incremental( self, sx, sy ):
+        if self.last_view is None:
+            return False
+        lsx, lsy, last_index, last_version, lpx, lpy, last_locked = self.last_view
+        vs_width = self.viewscreen_options[self.viewscreen_index]
+        if last_index != self.viewscreen_index or last_version != self.board.map_version:
+            return False
+        if abs( sx - lsx ) >= vs_width or abs( sy - lsy ) >= vs_width:
+            return False
+
+        # Map tiles that need to be redrawn
+        dirty = set( self.board.changed_tiles )
+        self.board.changed_tiles.clear()
+        dirty.add( ( lpx, lpy ) )
+        dirty.add( ( self.board.player.x, self.board.player.y ) )
+
+        rects = []
+        view_rect = pygame.Rect( 0, 0, vs_width * self.tile_width, vs_width * self.tile_width )
+        scrolled = ( sx, sy ) != ( lsx, lsy )
+        if scrolled:
+            # Shift what is already on screen, then draw the columns and rows that scrolled into view
+            self.display.subsurface( view_rect ).scroll( ( lsx - sx ) * self.tile_width, ( lsy - sy ) * self.tile_width )
+            # The first column has no left grid line, so also redraw the column that scrolled into
+            #   the first column, or the old first column after it scrolled right
+            if sx > lsx:
+                new_cols = list( range( vs_width - ( sx - lsx ), vs_width ) ) + [ 0 ]
+            else:
+                new_cols = range( 0, lsx - sx + 1 )
+            if sy > lsy:
+                new_rows = range( vs_width - ( sy - lsy ), vs_width )
+            else:
+                new_rows = range( 0, lsy - sy )
+            for vx in new_cols:
+                for vy in range( vs_width ):
+                    dirty.add( ( sx + vx, sy + vy ) )
+            for vy in new_rows:
+                for vx in range( vs_width ):
+                    dirty.add( ( sx + vx, sy + vy ) )
+            rects.append( view_rect )
+
+        for x, y in dirty:
+            vx = x - sx
+            vy = y - sy
+            if 0 <= vx < vs_width and 0 <= vy < vs_width:
+                cell_rect = self.render_tile( vx, vy, self.display_code( x, y ) )
+                if not scrolled:
+                    rects.append( cell_rect )
+        self.render_player( sx, sy )
+
+        # The menu only changes when the objective does
+        if last_locked != self.board.door.locked:
+            rects.append( self.render_menu() )
+
+        # Push only the changed parts of the frame to the display
+        self.present( rects )
+        return True
+
+    """
+        Profiler Overlay
+
+        F3 starts and stops the profiler. While it runs, the menu area shows a graph of the last
+            frame times, with a line at the frame budget of 1 / fps seconds, next to the mean time
+            of every phase. F4 dumps the recorded frames to a JSON file
+    """
+    def start_profiler( self ):
+        if self.profiler is None:
+            self.profiler = Profiler()
+            self.profiler.instrument( self )
+            self.new_frame = True
+            logger.info( "Profiler started" )
+
+    def stop_profiler( self ):
+        if self.profiler is None:
+            return
+        logger.info( "%s", self.profiler.report() )
+        if self.profile_dump is not None:
+            self.profiler.dump( self.profile_dump )
+        self.profiler.uninstrument()
+        self.profiler = None
+        # Put the menu back
+        self.last_view = None
+        self.new_frame = True
+        logger.info( "Profiler stopped" )
+
+    def toggle_profiler( self ):
+        if self.profiler is None:
+            self.start_profiler()
+        else:
+            self.stop_profiler()
+
+    def render_profile( self ):
+        profiler = self.profiler
+        top = self.screen_height - self.menu_height + 1
+        area = pygame.Rect( 0, top, self.screen_width, self.menu_height - 1 )
+        self.display.fill( ( 20, 20, 20 ), area )
+
+        # Frame time graph on the left, 2 pixels per frame, the frame budget halfway up
+        budget = 1 / self.fps
+        graph_height = area.height - 10
+        frames = profiler.recent()[ -( self.screen_width // 4 ) : ]
+        for i, frame in enumerate( frames ):
+            height = min( int( frame["frame"] / ( 2 * budget ) * graph_height ), graph_height )
+            color = ( 80, 200, 80 ) if frame["frame"] <= budget else ( 220, 60, 60 )
+            self.display.fill( color, ( 5 + 2 * i, area.bottom - 5 - height, 2, height ) )
+        self.display.fill( ( 200, 200, 200 ), ( 5, area.bottom - 5 - graph_height // 2, self.screen_width // 2, 1 ) )
+
+        # Phase breakdown on the right. Rebuilding the text every frame would cost more than the rest
+        if self.profile_text is None or profiler.count - self.profile_text_frame >= 15:
+            lines = [ f"{phase:>7} {mean * 1000:7.2f} ms  max {peak * 1000:7.2f}" for phase, ( mean, peak ) in profiler.summary().items() ]
+            self.profile_text = [ self.font.render( line, True, ( 230, 230, 230 ) ) for line in lines ]
+            self.profile_text_frame = profiler.count
+        for line, text in enumerate( self.profile_text ):
+            self.display.blit( text, ( self.screen_width // 2 + 20, top + 2 + line * 17 ) )
+
+        pygame.display.update( area )
 
     def exit_game( self ):
+        self.stop_profiler()
+        if self.journal is not None:
+            self.journal.close( self.frame_number(), self.state() )
+            self.journal = None
+        if self.levels is not None:
+            self.levels.stop()
         pygame.quit()
-        log(f"Thank you for playing my Maze Runner!", 0)
+        logger.info( "Thank you for playing my Maze Runner!" )
+
+    # Called at a fixed rate by the "fixed" scheduler. Applies the input that arrived since the last update
+    def update( self ):
+        events = self.queued_events
+        self.queued_events = []
+        self.input( events )
+
+    """
+        Main Loop Schedulers
+
+        "cap"   : render and handle input, then sleep so the loop runs at most fps times a second
+        "wait"  : sleep until an event arrives whenever there is nothing new to draw
+        "fixed" : run update() exactly fps times per second of game time, separately from rendering,
+                  which is capped at fps
+
+        Each one records how much of its time the loop spent asleep in self.stats
+    """
+    def run_cap( self, clock ):
+        while self.running:
+            self.advance_travel()
+            self.stats.frame( self.new_frame )
+            self.render()
+            self.input()
+            self.stats.idle( clock.tick( self.fps ) / 1000 - clock.get_rawtime() / 1000 )
+
+    def run_wait( self ):
+        # Wake up now and then even without input so the stats keep ticking
+        timeout = 250
+        while self.running:
+            self.advance_travel()
+            self.stats.frame( self.new_frame )
+            self.render()
+            start = time.perf_counter()
+            # While traveling or holding a key, only sleep until the next steps are due
+            wake = [ t for t in ( self.travel_timeout(), self.repeat_timeout() ) if t is not None ]
+            event = pygame.event.wait( min( wake ) if wake else timeout )
+            self.stats.idle( time.perf_counter() - start )
+            if event.type == pygame.NOEVENT:
+                # Held keys repeat even when no events arrive
+                if self.held_keys:
+                    self.input( [] )
+                continue
+            self.input( [ event ] + pygame.event.get() )
+
+    def run_fixed( self, clock ):
+        step = 1 / self.fps
+        lag = 0.0
+        last = time.perf_counter()
+        while self.running:
+            now = time.perf_counter()
+            lag += now - last
+            last = now
+
+            self.queued_events.extend( pygame.event.get() )
+            while lag >= step and self.running:
+                self.stats.updates += 1
+                self.update()
+                lag -= step
+
+            self.advance_travel()
+            self.stats.frame( self.new_frame )
+            self.render()
+            self.stats.idle( clock.tick( self.fps ) / 1000 - clock.get_rawtime() / 1000 )
 
     # Handle main game loop
     def run(self):
+        # Start the clock first, so the first level is recorded at frame 0
+        self.stats = FrameStats()
+
         # Call the setup function
         self.setup()
 
         # Enter game loop
-        while self.running:
-            # Render screen
-            self.render()
-            # Parse user input
-            self.input()
+        if self.scheduler == "cap":
+            self.run_cap( pygame.time.Clock() )
+        elif self.scheduler == "fixed":
+            self.run_fixed( pygame.time.Clock() )
+        else:
+            self.run_wait()
+
+        logger.info( "%s", self.stats.report() )
 
         # Once game is over, clear memory
         self.exit_game()
 
+    """
+        Play back a recorded Journal
+
+        realtime -> True to apply each action at the time it was recorded, False to apply them as
+                    fast as possible, drawing one frame per recorded frame
+
+        The window can still be closed ( or ESC pressed ) to stop early. Returns True if the replay
+            ended in the same state as the recorded session
+    """
+    def replay( self, journal, realtime=True ):
+        if journal.world != ( self.world_seeds is not None ) or journal.width != self.map_width:
+            raise ValueError( "The journal was recorded in a different game mode" )
+        self.replaying = True
+        self.running = True
+        self.stats = FrameStats()
+        events = journal.events
+        for i, ( frame, kind, value ) in enumerate( events ):
+            if realtime:
+                delay = self.stats.start + frame / journal.fps - time.perf_counter()
+                if delay > 0:
+                    time.sleep( delay )
+                    self.stats.idle( delay )
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or ( event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE ):
+                    self.running = False
+            if not self.running:
+                break
+
+            if kind == JOURNAL_LEVEL:
+                self.load( value )
+            elif self.apply( value ):
+                self.new_frame = True
+
+            # Draw once all the actions of this frame are in
+            if i + 1 == len( events ) or events[ i + 1 ][0] != frame:
+                self.stats.frame( self.new_frame )
+                self.render()
+
+        self.replaying = False
+        matched = journal.matches( self.state() )
+        logger.info( "%s", self.stats.report() )
+        if matched:
+            logger.info( "Replay of %d events matched the recorded session", len( events ) )
+        else:
+            logger.warning( "Replay ended in state %s, the recorded session ended in %s", self.state(), journal.end )
+        return matched
+
 
 # Program execution begins here
 if __name__ == '__main__':
-    if enable_log:
-        log(f"To disable logs, set enable log ( at the top of this file ) to False", 2)
+    parser = argparse.ArgumentParser( description="Maze Runner" )
+    parser.add_argument( "--seed", type=int, default=None, help="seed for the sequence of levels" )
+    parser.add_argument( "--render", choices=[ "incremental", "full" ], default="incremental",
+                         help="redraw only what changed each frame, or the whole window" )
+    parser.add_argument( "--scheduler", choices=[ "wait", "cap", "fixed" ], default="wait",
+                         help="how to pace the main loop" )
+    parser.add_argument( "--fps", type=int, default=60, help="frame rate cap ( and fixed update rate )" )
+    parser.add_argument( "--world", action="store_true", help="explore an endless chunked world instead of separate levels" )
+    parser.add_argument( "--fog", type=int, default=None, metavar="RADIUS", help="play with fog of war, seeing RADIUS tiles around the player" )
+    parser.add_argument( "--record", default=None, metavar="PATH", help="write every action to an input journal at PATH" )
+    parser.add_argument( "--replay", default=None, metavar="PATH",
+                         help="play back the input journal at PATH in real time ( as fast as possible with --headless or --fast )" )
+    parser.add_argument( "--fast", action="store_true", help="replay: render the journal as fast as possible" )
+    parser.add_argument( "--profile", action="store_true", help="start with the frame profiler running ( F3 toggles it )" )
+    parser.add_argument( "--profile-dump", default=None, metavar="PATH", help="write the profiled frames to PATH as JSON when the profiler stops" )
+    parser.add_argument( "--cprofile", default=None, metavar="PATH", help="run the session under cProfile and save the stats to PATH" )
+    parser.add_argument( "--headless", action="store_true", help="play without a window and report steps/sec and levels/sec" )
+    parser.add_argument( "--script", default=None, metavar="PATH",
+                         help="headless: file of actions ( w a s d, space to interact, r for a new level ). Random moves if not given" )
+    parser.add_argument( "--steps", type=int, default=1000000, help="headless: most actions to run" )
+    parser.add_argument( "--levels", type=int, default=100, help="headless: extra levels to generate back to back" )
+    parser.add_argument( "--map-width", type=int, default=61, help="headless: map width in tiles. Other widths use the BSP generator" )
+    parser.add_argument( "--log-level", choices=[ "DEBUG", "INFO", "WARNING", "ERROR" ], default="INFO",
+                         help="only log messages at this level and above. DEBUG logs every move and frame" )
+    parser.add_argument( "--log-json", default=None, metavar="PATH", help="also append log messages to PATH as JSON lines" )
+    args = parser.parse_args()
+
+    configure_logging( args.log_level, args.log_json )
+
+    if args.headless and args.replay is not None:
+        journal = Journal.load( args.replay )
+        runner = HeadlessRunner( journal.width, None if journal.width == 61 else BSPGenerator(), args.seed )
+        matched = runner.replay( journal )
+        stats = runner.stats()
+        logger.info( "%d steps replayed in %.3fs ( %.0f steps/sec ), %d levels completed",
+                     stats["steps"], stats["step_seconds"], stats["steps_per_sec"], stats["levels_completed"] )
+        if not matched:
+            logger.warning( "Replay ended in state %s, the recorded session ended in %s", runner.state(), journal.end )
+    elif args.headless:
+        runner = HeadlessRunner( args.map_width, None if args.map_width == 61 else BSPGenerator(), args.seed )
+        if args.script is not None:
+            with open( args.script ) as script:
+                actions = parse_script( script.read() )
+        else:
+            actions = random_actions( args.steps, args.seed )
+        runner.run( actions, args.steps )
+        stats = runner.run_levels( args.levels )
+        logger.info( "%d steps in %.3fs ( %.0f steps/sec ), %d levels completed",
+                     stats["steps"], stats["step_seconds"], stats["steps_per_sec"], stats["levels_completed"] )
+        logger.info( "%d levels generated in %.3fs ( %.1f levels/sec )",
+                     args.levels, stats["level_seconds"], stats["levels_per_sec"] )
     else:
-        log(f"To enable logs, set enable log ( at the top of this file ) to True", 2)
-    game = Engine()
-    game.run()
\ No newline at end of file
+        game = Engine( args.seed, args.render, args.scheduler, args.fps, args.world, args.record, args.fog )
+        game.profile_dump = args.profile_dump
+        if args.profile:
+            game.start_profiler()
+        profile = cProfile.Profile() if args.cprofile is not None else None
+        if profile is not None:
+            profile.enable()
+        if args.replay is not None:
+            game.replay( Journal.load( args.replay ), not args.fast )
+            game.exit_game()
+        else:
+            game.run()
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats( args.cprofile )
+            logger.info( "Saved cProfile stats to %s", args.cprofile )
\ No newline at end of file
@@ -0,0 +1,193 @@
+import argparse
+import random
+import sys
+
+import numpy
+
+import Daniel_Krause_CSE_120_Final as maze
+
+"""
+    Batch Environment
+
+    Holds count independent levels in stacked NumPy arrays and steps all of them at once. Each call
+        to step() takes one action per level ( the ACTION_* codes from the game ) and applies the
+        same rules as Board.move and Board.player_interaction as whole-array operations:
+
+        - a move outside the map does nothing
+        - a move into a WALL does nothing
+        - interacting on the key picks it up, turns its tile to FLOOR, and unlocks the door
+        - otherwise, interacting on the unlocked door finishes the level
+        - ACTION_NEW_LEVEL throws the level away, like pressing r
+        - the zoom actions do nothing, like in the headless runner
+
+    Finished and thrown away levels are replaced with the next level from a LevelPregenerator, or
+        from levels if given: any object with a next_level() method, such as maze_farm.FarmLevelSource
+"""
+class BatchEnv:
+    # Change in x and y for every action code. Actions that are not moves do not move
+    DX = numpy.array( [ maze.MOVES.get( a, ( 0, 0 ) )[0] for a in range( maze.ACTION_ZOOM_OUT + 1 ) ], dtype=numpy.int64 )
+    DY = numpy.array( [ maze.MOVES.get( a, ( 0, 0 ) )[1] for a in range( maze.ACTION_ZOOM_OUT + 1 ) ], dtype=numpy.int64 )
+
+    def __init__(self, icount, iwidth=61, igenerator=None, iseed=None, ilevels=None):
+        self.count = icount
+        self.width = iwidth
+        if ilevels is None:
+            ilevels = maze.LevelPregenerator( iwidth, igenerator, iseed, iahead=min( icount, 64 ) )
+        self.levels = ilevels
+
+        # One tile grid per level, indexed [ level, x, y ] like Board.board
+        self.grids = numpy.zeros( ( icount, iwidth, iwidth ), dtype=numpy.uint8 )
+        self.player_x = numpy.zeros( icount, dtype=numpy.int64 )
+        self.player_y = numpy.zeros( icount, dtype=numpy.int64 )
+        self.key_x = numpy.zeros( icount, dtype=numpy.int64 )
+        self.key_y = numpy.zeros( icount, dtype=numpy.int64 )
+        self.door_x = numpy.zeros( icount, dtype=numpy.int64 )
+        self.door_y = numpy.zeros( icount, dtype=numpy.int64 )
+        self.locked = numpy.ones( icount, dtype=bool )
+        self.seeds = numpy.zeros( icount, dtype=numpy.int64 )
+
+        self.index = numpy.arange( icount )
+        self.steps = 0
+        self.levels_completed = 0
+
+        for i in range( icount ):
+            self.reset( i )
+
+    # Start pre-generating levels on a background thread. Only needed for the default level source
+    def start( self ):
+        if isinstance( self.levels, maze.LevelPregenerator ):
+            self.levels.start()
+
+    def stop( self ):
+        if isinstance( self.levels, maze.LevelPregenerator ):
+            self.levels.stop()
+
+    # Replace level i with the next level from the generator
+    def reset( self, i ):
+        level = self.levels.next_level()
+        self.grids[ i ] = numpy.frombuffer( level.cells, dtype=numpy.uint8 ).reshape( self.width, self.width )
+        self.player_x[ i ], self.player_y[ i ] = level.player
+        self.key_x[ i ], self.key_y[ i ] = level.key
+        self.door_x[ i ], self.door_y[ i ] = level.door
+        self.locked[ i ] = level.locked
+        self.seeds[ i ] = level.seed
+
+    """
+        Apply one action to every level
+
+        actions -> array of count action codes
+
+        Returns ( rewards, done ): a float32 reward of 1 for every level that was finished this
+            step, and a bool array marking those levels. Finished levels are reset before returning
+    """
+    def step( self, actions ):
+        actions = numpy.asarray( actions, dtype=numpy.int64 )
+        if actions.shape != ( self.count, ):
+            raise ValueError( f"Expected {self.count} actions, got an array of shape {actions.shape}" )
+        if self.count and ( actions.min() < 0 or actions.max() > maze.ACTION_ZOOM_OUT ):
+            raise ValueError( f"Action codes must be between 0 and {maze.ACTION_ZOOM_OUT}" )
+        self.steps += self.count
+
+        # Moves: stay inside the map and out of walls
+        nx = self.player_x + self.DX[ actions ]
+        ny = self.player_y + self.DY[ actions ]
+        in_bounds = ( nx >= 0 ) & ( nx < self.width ) & ( ny >= 0 ) & ( ny < self.width )
+        tiles = self.grids[ self.index, numpy.clip( nx, 0, self.width - 1 ), numpy.clip( ny, 0, self.width - 1 ) ]
+        moved = in_bounds & ( tiles != maze.TILE_WALL ) & ( actions < maze.ACTION_INTERACT )
+        self.player_x = numpy.where( moved, nx, self.player_x )
+        self.player_y = numpy.where( moved, ny, self.player_y )
+
+        # Interactions: the key is checked first, the door only if the player is not on the key
+        interact = actions == maze.ACTION_INTERACT
+        on_key = interact & ( self.player_x == self.key_x ) & ( self.player_y == self.key_y )
+        on_door = interact & ~on_key & ( self.player_x == self.door_x ) & ( self.player_y == self.door_y )
+        done = on_door & ~self.locked
+
+        picked = numpy.flatnonzero( on_key )
+        if len( picked ):
+            self.grids[ picked, self.key_x[ picked ], self.key_y[ picked ] ] = maze.TILE_FLOOR
+            self.grids[ picked, self.door_x[ picked ], self.door_y[ picked ] ] = maze.TILE_UNLOCKED
+            self.key_x[ picked ] = -1
+            self.key_y[ picked ] = -1
+            self.locked[ picked ] = False
+
+        # Replace finished and thrown away levels
+        for i in numpy.flatnonzero( done | ( actions == maze.ACTION_NEW_LEVEL ) ):
+            self.reset( i )
+        self.levels_completed += int( done.sum() )
+
+        return done.astype( numpy.float32 ), done
+
+
+"""
+    Equivalence Check
+
+    Steps a BatchEnv and one Board per level side by side with the same actions, and compares the
+        player, key, door, and tiles after every step. Most actions walk towards the key and then
+        the door so levels get finished, the rest are random codes ( zoom and new level included ).
+        Returns a list of ( step, level, what differed ), empty if the two always agreed
+"""
+def check( count=16, steps=2000, width=61, seed=0 ):
+    levels = maze.LevelPregenerator( width, None, seed, iahead=min( count, 64 ) )
+    env = BatchEnv( count, width, ilevels=levels )
+    boards = [ maze.Board( width ) for _ in range( count ) ]
+    finders = [ maze.PathFinder( board ) for board in boards ]
+    for i, board in enumerate( boards ):
+        board.load_level( levels.level( int( env.seeds[ i ] ) ) )
+    rng = random.Random( seed )
+
+    mismatches = []
+    for step in range( steps ):
+        actions = [ policy( board, finder, rng ) for board, finder in zip( boards, finders ) ]
+        _, done = env.step( actions )
+        for i, ( board, action ) in enumerate( zip( boards, actions ) ):
+            finished = False
+            if action in maze.MOVES:
+                board.move( *maze.MOVES[ action ] )
+            elif action == maze.ACTION_INTERACT:
+                finished = board.player_interaction()
+            if finished != bool( done[ i ] ):
+                mismatches.append( ( step, i, "finished" ) )
+            # The env has already moved on to its next level, so load the same one
+            if finished or action == maze.ACTION_NEW_LEVEL:
+                board.load_level( levels.level( int( env.seeds[ i ] ) ) )
+
+            state = ( board.player.x, board.player.y, board.key.x, board.key.y, board.door.x, board.door.y, board.door.locked )
+            expected = ( env.player_x[ i ], env.player_y[ i ], env.key_x[ i ], env.key_y[ i ],
+                         env.door_x[ i ], env.door_y[ i ], env.locked[ i ] )
+            if state != tuple( expected ):
+                mismatches.append( ( step, i, "objects" ) )
+            if env.grids[ i ].tobytes() != bytes( board.board.cells ):
+                mismatches.append( ( step, i, "tiles" ) )
+    return mismatches
+
+# Head for the key, then the door. One action in four is a random code instead
+def policy( board, finder, rng ):
+    if rng.random() < 0.25:
+        return rng.choice( ( maze.ACTION_RIGHT, maze.ACTION_LEFT, maze.ACTION_UP, maze.ACTION_DOWN, maze.ACTION_INTERACT,
+                             maze.ACTION_ZOOM_IN, maze.ACTION_ZOOM_OUT ) if rng.random() < 0.99 else ( maze.ACTION_NEW_LEVEL, ) )
+    target = board.key if board.key.x >= 0 else board.door
+    path = finder.path( board.player.x, board.player.y, target.x, target.y )
+    if path is None or len( path ) < 2:
+        return maze.ACTION_INTERACT
+    return maze.Engine.path_actions( path[ : 2 ] )[0]
+
+
+# Check that the batch env plays exactly like separate Boards
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description="Check BatchEnv against separate Boards" )
+    parser.add_argument( "--count", type=int, default=16, help="number of levels stepped at once" )
+    parser.add_argument( "--steps", type=int, default=2000, help="number of steps" )
+    parser.add_argument( "--width", type=int, default=61, help="map width in tiles" )
+    parser.add_argument( "--seed", type=int, default=0, help="seed for the levels and actions" )
+    args = parser.parse_args()
+
+    # The Boards log every key and door, so only show warnings while checking
+    maze.configure_logging( "WARNING" )
+    mismatches = check( args.count, args.steps, args.width, args.seed )
+    maze.logger.setLevel( "INFO" )
+    for step, i, what in mismatches[ : 20 ]:
+        maze.logger.error( "Step %d, level %d: the %s differ", step, i, what )
+    if mismatches:
+        sys.exit( 1 )
+    maze.logger.info( "%d levels agreed for %d steps", args.count, args.steps )
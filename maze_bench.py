@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# Render benchmarks run without a window
+os.environ.setdefault( "SDL_VIDEODRIVER", "dummy" )
+
+import Daniel_Krause_CSE_120_Final as maze
+
+"""
+    Benchmark Suite
+
+    Times the hot paths of the game and reports percentiles of the time per operation:
+
+        generate/<width>         -> Board.board_clear + Board.new_level
+        move, interact           -> Board.move and Board.player_interaction
+        render/<mode>/zoom<n>    -> Engine.render after one move, at every viewscreen size
+        render_menu              -> Engine.render_menu
+        replay/headless          -> HeadlessRunner.replay of a whole session
+        replay/rendered          -> Engine.replay of the same session, as fast as possible
+        startup/import           -> a new Python process importing the game module, as headless tools do
+        startup/first_frame      -> from making the Engine to its first frame on screen ( one sample )
+
+    Operations that take well under a millisecond are timed in batches and each sample is the
+        batch time divided by the batch size. Results are written as JSON and can be compared
+        with a stored baseline, in which case a benchmark whose median got more than threshold
+        slower counts as a regression
+"""
+
+def summarize( samples ):
+    ordered = sorted( samples )
+    mean = sum( ordered ) / len( ordered )
+    return {
+        "unit": "seconds per op",
+        "samples": len( ordered ),
+        "mean": mean,
+        "min": ordered[0],
+        "p50": maze.percentile( ordered, 50 ),
+        "p90": maze.percentile( ordered, 90 ),
+        "p99": maze.percentile( ordered, 99 ),
+        "max": ordered[-1],
+        "ops_per_sec": 1 / maze.percentile( ordered, 50 ) if ordered[0] > 0 else None,
+    }
+
+# Call run( batch ) repeat times and return the time per op of each call
+def sample( run, repeat, batch=1 ):
+    samples = []
+    for _ in range( repeat ):
+        start = time.perf_counter()
+        run( batch )
+        samples.append( ( time.perf_counter() - start ) / batch )
+    return samples
+
+def bench_generate( width, repeat ):
+    generator = None if width == 61 else maze.BSPGenerator()
+    board = maze.Board( width, generator )
+    seeds = random.Random( width )
+    def run( batch ):
+        for _ in range( batch ):
+            board.board_clear()
+            board.new_level( seed=seeds.getrandbits( 32 ) )
+    return sample( run, repeat, 20 if width <= 61 else 1 )
+
+def bench_move( repeat ):
+    board = maze.Board( 61 )
+    board.board_clear()
+    board.new_level( seed=1 )
+    moves = [ maze.MOVES[ action ] for action in maze.random_actions( 10000, 1, interact_chance=0 ) ]
+    def run( batch ):
+        move = board.move
+        for dx, dy in moves[ : batch ]:
+            move( dx, dy )
+    return sample( run, repeat, len( moves ) )
+
+def bench_interact( repeat ):
+    board = maze.Board( 61 )
+    board.board_clear()
+    board.new_level( seed=1 )
+    def run( batch ):
+        interact = board.player_interaction
+        for _ in range( batch ):
+            interact()
+    return sample( run, repeat, 10000 )
+
+# Write a journal of count random actions played from seed, and return its path
+def synthetic_journal( directory, count, seed ):
+    path = os.path.join( directory, "session.journal" )
+    runner = maze.HeadlessRunner( 61 )
+    writer = maze.JournalWriter( path, 61 )
+    seeds = random.Random( seed )
+    level_seed = seeds.getrandbits( 32 )
+    runner.load( level_seed )
+    writer.level( 0, level_seed )
+    for frame, action in enumerate( maze.random_actions( count, seed ) ):
+        writer.action( frame, action )
+        if action == maze.ACTION_INTERACT:
+            if runner.board.player_interaction():
+                level_seed = seeds.getrandbits( 32 )
+                runner.load( level_seed )
+                writer.level( frame, level_seed )
+        else:
+            runner.board.move( *maze.MOVES[ action ] )
+    writer.close( count, runner.state() )
+    return path
+
+def bench_replay_headless( journal, repeat ):
+    def run( batch ):
+        runner = maze.HeadlessRunner( 61 )
+        if not runner.replay( journal ):
+            raise RuntimeError( "Headless replay did not match the recorded session" )
+    return sample( run, repeat )
+
+def bench_import( repeat ):
+    command = [ sys.executable, "-c", "import Daniel_Krause_CSE_120_Final" ]
+    directory = os.path.dirname( os.path.abspath( __file__ ) )
+    samples = []
+    for _ in range( repeat ):
+        start = time.perf_counter()
+        subprocess.run( command, cwd=directory, check=True, stdout=subprocess.DEVNULL )
+        samples.append( time.perf_counter() - start )
+    return samples
+
+# Render benchmarks share one Engine, since PyGame only has one display
+def bench_render( engine, mode, zoom, repeat ):
+    engine.render_mode = mode
+    engine.viewscreen_index = zoom
+    engine.tile_width = int( engine.screen_width / engine.viewscreen_options[ zoom ] )
+    engine.last_view = None
+    engine.new_frame = True
+    engine.render()
+
+    moves = [ maze.MOVES[ action ] for action in maze.random_actions( repeat, zoom, interact_chance=0 ) ]
+    samples = []
+    for dx, dy in moves:
+        engine.board.move( dx, dy )
+        engine.new_frame = True
+        start = time.perf_counter()
+        engine.render()
+        samples.append( time.perf_counter() - start )
+    return samples
+
+def bench_render_menu( engine, repeat ):
+    def run( batch ):
+        for _ in range( batch ):
+            engine.render_menu()
+    return sample( run, repeat, 100 )
+
+def bench_replay_rendered( engine, journal, repeat ):
+    samples = []
+    for _ in range( repeat ):
+        start = time.perf_counter()
+        if not engine.replay( journal, realtime=False ):
+            raise RuntimeError( "Rendered replay did not match the recorded session" )
+        samples.append( time.perf_counter() - start )
+    return samples
+
+def run_suite( quick=False ):
+    scale = 0.2 if quick else 1
+    def repeat( count ):
+        return max( int( count * scale ), 3 )
+
+    results = {}
+    for width in ( 61, 250, 1000 ):
+        results[ f"generate/{width}" ] = summarize( bench_generate( width, repeat( 50 if width < 1000 else 10 ) ) )
+    results["move"] = summarize( bench_move( repeat( 50 ) ) )
+    results["interact"] = summarize( bench_interact( repeat( 50 ) ) )
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = maze.Journal.load( synthetic_journal( directory, int( 20000 * scale ), 7 ) )
+    results["replay/headless"] = summarize( bench_replay_headless( journal, repeat( 20 ) ) )
+    results["startup/import"] = summarize( bench_import( repeat( 10 ) ) )
+
+    if maze.load_pygame() is None:
+        maze.logger.warning( "PyGame is not installed, skipping the render benchmarks" )
+        return results
+
+    engine = maze.Engine( 1 )
+    try:
+        engine.setup()
+        engine.render()
+        results["startup/first_frame"] = summarize( [ engine.startup_mark - engine.startup_start ] )
+        for mode in ( "incremental", "full" ):
+            for zoom, tiles in enumerate( engine.viewscreen_options ):
+                results[ f"render/{mode}/zoom{tiles}" ] = summarize( bench_render( engine, mode, zoom, repeat( 300 ) ) )
+        results["render_menu"] = summarize( bench_render_menu( engine, repeat( 50 ) ) )
+
+        engine.render_mode = "incremental"
+        engine.viewscreen_index = 1
+        engine.tile_width = int( engine.screen_width / engine.viewscreen_options[1] )
+        short = maze.Journal( journal_prefix( journal, int( 2000 * scale ) ) )
+        results["replay/rendered"] = summarize( bench_replay_rendered( engine, short, repeat( 5 ) ) )
+    finally:
+        engine.exit_game()
+    return results
+
+# Return the bytes of a journal holding only the first count events of journal, without an end state
+def journal_prefix( journal, count ):
+    data = bytearray( maze.JOURNAL_HEADER.pack( maze.JOURNAL_MAGIC, maze.JOURNAL_VERSION, journal.world, journal.width, journal.fps ) )
+    last = 0
+    for frame, kind, value in journal.events[ : count ]:
+        data.append( kind if kind is not None else value )
+        maze.pack_varint( data, frame - last )
+        last = frame
+        if kind == maze.JOURNAL_LEVEL:
+            maze.pack_varint( data, value )
+    return bytes( data )
+
+"""
+    Compare results with a baseline
+
+    Returns a list of ( name, baseline p50, new p50, ratio ) for every benchmark whose median
+        time went up by more than threshold ( 0.1 is 10% slower )
+"""
+def compare( results, baseline, threshold ):
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get( "results", {} ).get( name )
+        if old is None or not old["p50"]:
+            continue
+        ratio = result["p50"] / old["p50"]
+        if ratio > 1 + threshold:
+            regressions.append( ( name, old["p50"], result["p50"], ratio ) )
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description="Benchmark Maze Runner's generation, movement, rendering and replay" )
+    parser.add_argument( "--output", default=None, metavar="PATH", help="write the results to PATH as JSON" )
+    parser.add_argument( "--baseline", default=None, metavar="PATH", help="compare with the results in PATH" )
+    parser.add_argument( "--threshold", type=float, default=0.1, help="slowdown of the median that counts as a regression ( default 0.1 )" )
+    parser.add_argument( "--quick", action="store_true", help="take fewer samples" )
+    args = parser.parse_args()
+
+    maze.configure_logging( "INFO" )
+    results = run_suite( args.quick )
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pygame": maze.pygame.version.ver if maze.pygame is not None else None,
+            "time": time.strftime( "%Y-%m-%dT%H:%M:%S" ),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    for name, result in results.items():
+        maze.logger.info( "%-28s p50 %10.3f us  p90 %10.3f us  p99 %10.3f us",
+                          name, result["p50"] * 1e6, result["p90"] * 1e6, result["p99"] * 1e6 )
+
+    if args.output is not None:
+        with open( args.output, "w" ) as file:
+            json.dump( report, file, indent=2 )
+
+    if args.baseline is not None:
+        with open( args.baseline ) as file:
+            regressions = compare( results, json.load( file ), args.threshold )
+        for name, old, new, ratio in regressions:
+            maze.logger.warning( "%s regressed: p50 %.3f us -> %.3f us ( %.2fx )", name, old * 1e6, new * 1e6, ratio )
+        if regressions:
+            sys.exit( 1 )
+        maze.logger.info( "No regressions against %s", args.baseline )
@@ -0,0 +1,192 @@
+import argparse
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import Daniel_Krause_CSE_120_Final as maze
+
+"""
+    Worker
+
+    Runs in a worker process. Attaches to the shared memory block the parent made for this job,
+        generates the level straight into it, and sends back only the small parts of the level:
+        the rooms, tunnels, and object locations. The tiles never get pickled
+"""
+def build_level( shm_name, width, generator, seed ):
+    shm = shared_memory.SharedMemory( name=shm_name )
+    try:
+        return build_into( shm.buf, width, generator, seed )
+    except BaseException as error:
+        # The traceback's frames still hold views of the block, which would stop it from closing
+        error.__traceback__ = None
+        raise
+    finally:
+        shm.close()
+
+def build_into( buffer, width, generator, seed ):
+    board = maze.Board( width, generator, buffer )
+    board.board_clear()
+    board.new_level( generator, seed )
+    rooms = [ ( room.x, room.y, room.w, room.h ) for room in board.rooms ]
+    return (
+        seed, rooms, ( board.player.x, board.player.y ),
+        ( board.key.x, board.key.y ), ( board.door.x, board.door.y ), board.door.locked, board.graph.edges
+    )
+
+"""
+    Shared Level
+
+    A Level whose cells live in a shared memory block written by a worker. cells is a memoryview
+        of the block, so nothing is copied until something like Board.load_level asks for it.
+        close() must be called once the level is no longer needed to free the block
+"""
+class SharedLevel( maze.Level ):
+    def __init__(self, ishm, iseed, iwidth, irooms, iplayer, ikey, idoor, ilocked, iedges=None):
+        super().__init__( iseed, iwidth, ishm.buf[ : iwidth * iwidth ], irooms, iplayer, ikey, idoor, ilocked, iedges )
+        self.shm = ishm
+
+    # Return a plain Level with its own copy of the cells, and free the shared block
+    def detach( self ):
+        level = maze.Level( self.seed, self.width, bytes( self.cells ), self.rooms, self.player, self.key, self.door, self.locked, self.edges )
+        self.close()
+        return level
+
+    def close( self ):
+        if self.shm is None:
+            return
+        self.cells.release()
+        self.cells = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+"""
+    Level Farm
+
+    Spreads level generation over a pool of worker processes. imap() takes any iterable of seeds
+        and yields SharedLevels as soon as they are done, so the first levels can be used while the
+        rest are still being built. At most max_pending jobs ( and shared blocks ) exist at a time
+"""
+class LevelFarm:
+    def __init__(self, iwidth, igenerator=None, iprocesses=None, imax_pending=None):
+        self.width = iwidth
+        self.generator = maze.BlockGenerator() if igenerator is None else igenerator
+        self.processes = iprocesses or os.cpu_count() or 1
+        self.max_pending = imax_pending or 2 * self.processes
+        self.pool = ProcessPoolExecutor( self.processes )
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc ):
+        self.close()
+
+    def close( self ):
+        self.pool.shutdown()
+
+    def submit( self, seed ):
+        shm = shared_memory.SharedMemory( create=True, size=self.width * self.width )
+        try:
+            future = self.pool.submit( build_level, shm.name, self.width, self.generator, seed )
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+        return future, shm
+
+    # Turn a finished job into a SharedLevel. Frees the block if the job failed
+    def collect( self, future, shm ):
+        try:
+            seed, rooms, player, key, door, locked, edges = future.result()
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+        rooms = [ maze.Room( *room ) for room in rooms ]
+        for room_id, room in enumerate( rooms ):
+            room.id = room_id
+        return SharedLevel( shm, seed, self.width, rooms, player, key, door, locked, edges )
+
+    # Yield a SharedLevel for every seed in seeds. If ordered is False they come in the order they finish
+    def imap( self, seeds, ordered=False ):
+        seeds = iter( seeds )
+        finished = object()
+        pending = {}
+        order = []
+        try:
+            while True:
+                # Keep the pool busy
+                while len( pending ) < self.max_pending:
+                    seed = next( seeds, finished )
+                    if seed is finished:
+                        break
+                    future, shm = self.submit( seed )
+                    pending[ future ] = shm
+                    order.append( future )
+                if not pending:
+                    return
+
+                if ordered:
+                    done = [ order[0] ]
+                    done[0].result()
+                else:
+                    done, _ = wait( pending, return_when=FIRST_COMPLETED )
+                for future in done:
+                    order.remove( future )
+                    yield self.collect( future, pending.pop( future ) )
+        finally:
+            # Free the blocks of any jobs the consumer did not wait for
+            for future, shm in pending.items():
+                future.cancel()
+                try:
+                    future.result()
+                except BaseException:
+                    pass
+                shm.close()
+                shm.unlink()
+
+    # Yield count levels for the same seed sequence a LevelPregenerator with this seed hands out
+    def levels( self, count, seed=None, ordered=False ):
+        seeds = random.Random( seed )
+        return self.imap( ( seeds.getrandbits( 32 ) for _ in range( count ) ), ordered )
+
+"""
+    Farm Level Source
+
+    Feeds levels from a LevelFarm to anything that asks for them one at a time with next_level(),
+        such as BatchEnv. Levels are copied out of shared memory as they are handed over
+"""
+class FarmLevelSource:
+    def __init__(self, ifarm, iseed=None):
+        self.stream = ifarm.imap( self.seed_sequence( iseed ), ordered=True )
+
+    @staticmethod
+    def seed_sequence( seed ):
+        seeds = random.Random( seed )
+        while True:
+            yield seeds.getrandbits( 32 )
+
+    def next_level( self ):
+        return next( self.stream ).detach()
+
+
+# Generate levels on every core and report throughput
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description="Generate Maze Runner levels on every core" )
+    parser.add_argument( "--count", type=int, default=1000, help="number of levels to generate" )
+    parser.add_argument( "--width", type=int, default=61, help="map width in tiles. Other widths than 61 use the BSP generator" )
+    parser.add_argument( "--seed", type=int, default=None, help="seed for the sequence of levels" )
+    parser.add_argument( "--processes", type=int, default=None, help="worker processes ( default: one per core )" )
+    args = parser.parse_args()
+
+    maze.configure_logging( "INFO" )
+    generator = None if args.width == 61 else maze.BSPGenerator()
+    start = time.perf_counter()
+    with LevelFarm( args.width, generator, args.processes ) as farm:
+        for level in farm.levels( args.count, args.seed ):
+            level.close()
+    elapsed = time.perf_counter() - start
+    maze.logger.info( "%d levels of %d by %d tiles in %.2fs ( %.1f levels/sec ) on %d processes",
+                      args.count, args.width, args.width, elapsed, args.count / elapsed, farm.processes )
@@ -0,0 +1,310 @@
+import argparse
+import itertools
+import mmap
+import random
+import struct
+import time
+import zlib
+
+import Daniel_Krause_CSE_120_Final as maze
+
+"""
+    Level Format
+
+    A level is stored as one record, little endian:
+
+        header : magic "MZLV", format version, compression, seed, width, player x / y, key x / y,
+                 door x / y, door locked, room count, edge count, length of the stored tiles
+        rooms  : x, y, w, h for every room, in Board.rooms order
+        edges  : room, room, tunnel length for every edge of the room graph
+        tiles  : the tile codes, column by column like TileGrid
+
+    The tiles are stored as is, run-length encoded ( pairs of run length and tile code ), or zlib
+        compressed. Uncompressed tiles can be used straight from a memory-mapped file. A level
+        without a seed is stored with the seed NO_SEED
+"""
+MAGIC = b"MZLV"
+VERSION = 1
+
+COMPRESS_NONE = 0
+COMPRESS_RLE = 1
+COMPRESS_ZLIB = 2
+COMPRESSION = { None: COMPRESS_NONE, "rle": COMPRESS_RLE, "zlib": COMPRESS_ZLIB }
+
+HEADER = struct.Struct( "<4sHHQIiiiiiiB3xIII" )
+# Stored in place of the seed of a Level whose seed is None. Real seeds must be below it
+NO_SEED = ( 1 << 64 ) - 1
+ROOM = struct.Struct( "<iiii" )
+EDGE = struct.Struct( "<III" )
+
+class FormatError( ValueError ):
+    pass
+
+# Run-length encode tiles as ( run length, code ) byte pairs. Runs longer than 255 are split
+def rle_encode( cells ):
+    out = bytearray()
+    for code, run in itertools.groupby( bytes( cells ) ):
+        length = sum( 1 for _ in run )
+        while length > 255:
+            out += bytes( ( 255, code ) )
+            length -= 255
+        out += bytes( ( length, code ) )
+    return bytes( out )
+
+def rle_decode( data, size ):
+    out = bytearray()
+    for i in range( 0, len( data ), 2 ):
+        out += bytes( data[ i + 1 : i + 2 ] ) * data[ i ]
+    if len( out ) != size:
+        raise FormatError( f"Run-length tiles decode to {len( out )} bytes, expected {size}" )
+    return out
+
+# Return the bytes of a record for level
+def pack_level( level, compression=None ):
+    if compression not in COMPRESSION:
+        raise ValueError( f"Unknown compression {compression!r}, expected one of {list( COMPRESSION )}" )
+    seed = level.seed
+    if seed is None:
+        seed = NO_SEED
+    elif not isinstance( seed, int ) or not 0 <= seed < NO_SEED:
+        raise ValueError( f"A level seed must be None or an int from 0 to {NO_SEED - 1}, got {level.seed!r}" )
+    cells = level.cells
+    if compression == "rle":
+        cells = rle_encode( cells )
+    elif compression == "zlib":
+        cells = zlib.compress( cells )
+
+    header = HEADER.pack(
+        MAGIC, VERSION, COMPRESSION[ compression ], seed, level.width,
+        *level.player, *level.key, *level.door, level.locked,
+        len( level.rooms ), len( level.edges ), len( cells )
+    )
+    rooms = b"".join( ROOM.pack( room.x, room.y, room.w, room.h ) for room in level.rooms )
+    edges = b"".join( EDGE.pack( *edge ) for edge in level.edges )
+    return b"".join( ( header, rooms, edges, cells ) )
+
+"""
+    Read the record starting at offset in buffer
+
+    Returns ( level, end offset ). When the tiles are not compressed, level.cells is a memoryview
+        of buffer, so nothing is copied
+"""
+def unpack_level( buffer, offset=0 ):
+    view = memoryview( buffer )
+    if len( view ) - offset < HEADER.size:
+        raise FormatError( f"Truncated level record at offset {offset}" )
+    ( magic, version, compression, seed, width, px, py, kx, ky, dx, dy, locked,
+      room_count, edge_count, cells_length ) = HEADER.unpack_from( view, offset )
+    if magic != MAGIC:
+        raise FormatError( f"Not a level record at offset {offset}" )
+    if version != VERSION:
+        raise FormatError( f"Unsupported level format version {version}" )
+    offset += HEADER.size
+
+    rooms = []
+    for room_id, ( x, y, w, h ) in enumerate( ROOM.iter_unpack( view[ offset : offset + room_count * ROOM.size ] ) ):
+        room = maze.Room( x, y, w, h )
+        room.id = room_id
+        rooms.append( room )
+    offset += room_count * ROOM.size
+    edges = list( EDGE.iter_unpack( view[ offset : offset + edge_count * EDGE.size ] ) )
+    offset += edge_count * EDGE.size
+
+    stored = view[ offset : offset + cells_length ]
+    if len( stored ) != cells_length:
+        raise FormatError( f"Truncated tiles at offset {offset}" )
+    size = width * width
+    if compression == COMPRESS_NONE:
+        cells = stored
+    elif compression == COMPRESS_RLE:
+        cells = rle_decode( stored, size )
+    elif compression == COMPRESS_ZLIB:
+        cells = zlib.decompress( stored )
+    else:
+        raise FormatError( f"Unknown compression {compression}" )
+    if len( cells ) != size:
+        raise FormatError( f"Expected {size} tiles, found {len( cells )}" )
+
+    if seed == NO_SEED:
+        seed = None
+    level = maze.Level( seed, width, cells, rooms, ( px, py ), ( kx, ky ), ( dx, dy ), bool( locked ), edges )
+    return level, offset + cells_length
+
+def save_level( path, level, compression=None ):
+    with open( path, "wb" ) as file:
+        file.write( pack_level( level, compression ) )
+
+"""
+    Level File
+
+    Memory-maps a saved level. level.cells points into the mapping, and board() lays a Board's tile
+        grid directly over it. The mapping is copy-on-write, so playing on the board never changes
+        the file. close() must be called once the level and board are no longer used
+"""
+class LevelFile:
+    def __init__(self, ipath):
+        with open( ipath, "rb" ) as file:
+            self.map = mmap.mmap( file.fileno(), 0, access=mmap.ACCESS_COPY )
+        self.level, _ = unpack_level( self.map )
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc ):
+        self.close()
+
+    # Return a Board playing the level, without copying the tiles if they are not compressed
+    def board( self, generator=None ):
+        level = self.level
+        if not isinstance( level.cells, memoryview ):
+            board = maze.Board( level.width, generator )
+            board.load_level( level )
+            return board
+        board = maze.Board( level.width, generator, level.cells )
+        board.load_level( maze.Level(
+            level.seed, level.width, board.board.cells, level.rooms,
+            level.player, level.key, level.door, level.locked, level.edges
+        ) )
+        return board
+
+    # Boards from board() must not be used after this
+    def close( self ):
+        if self.map is None:
+            return
+        if isinstance( self.level.cells, memoryview ):
+            self.level.cells.release()
+        self.level = None
+        try:
+            self.map.close()
+        except BufferError:
+            # A board still holds a view of the mapping. It is freed along with the board
+            pass
+        self.map = None
+
+"""
+    Corpus
+
+    Many level records in one file, followed by an index of where each record starts:
+
+        header  : magic "MZCP", format version, level count, offset of the index
+        records : one level record per level
+        index   : one 8 byte offset per level
+
+    CorpusWriter streams records to disk and writes the index on close. Corpus memory-maps the
+        file, so level( n ) jumps straight to record n and only that record is parsed
+"""
+CORPUS_MAGIC = b"MZCP"
+CORPUS_HEADER = struct.Struct( "<4sHxxQQ" )
+OFFSET = struct.Struct( "<Q" )
+
+class CorpusWriter:
+    def __init__(self, ipath, icompression=None):
+        self.file = open( ipath, "wb" )
+        self.compression = icompression
+        self.offsets = []
+        self.file.write( CORPUS_HEADER.pack( CORPUS_MAGIC, VERSION, 0, 0 ) )
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc ):
+        self.close()
+
+    def __len__( self ):
+        return len( self.offsets )
+
+    def add( self, level ):
+        self.offsets.append( self.file.tell() )
+        self.file.write( pack_level( level, self.compression ) )
+
+    def close( self ):
+        if self.file is None:
+            return
+        index = self.file.tell()
+        self.file.write( b"".join( OFFSET.pack( offset ) for offset in self.offsets ) )
+        self.file.seek( 0 )
+        self.file.write( CORPUS_HEADER.pack( CORPUS_MAGIC, VERSION, len( self.offsets ), index ) )
+        self.file.close()
+        self.file = None
+
+class Corpus:
+    def __init__(self, ipath):
+        with open( ipath, "rb" ) as file:
+            self.map = mmap.mmap( file.fileno(), 0, access=mmap.ACCESS_READ )
+        magic, version, self.count, index = CORPUS_HEADER.unpack_from( self.map, 0 )
+        if magic != CORPUS_MAGIC:
+            self.map.close()
+            raise FormatError( f"{ipath} is not a level corpus" )
+        if version != VERSION:
+            self.map.close()
+            raise FormatError( f"Unsupported corpus format version {version}" )
+        if index + self.count * OFFSET.size > len( self.map ):
+            self.map.close()
+            raise FormatError( f"{ipath} is truncated" )
+        self.index = memoryview( self.map )[ index : index + self.count * OFFSET.size ].cast( "Q" )
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc ):
+        self.close()
+
+    def __len__( self ):
+        return self.count
+
+    # Return level n. Uncompressed tiles are a read-only view of the file, so copy them to keep them
+    def level( self, n ):
+        if not 0 <= n < self.count:
+            raise IndexError( f"Level {n} is out of range for a corpus of {self.count} levels" )
+        return unpack_level( self.map, self.index[ n ] )[0]
+
+    def __iter__( self ):
+        for n in range( self.count ):
+            yield self.level( n )
+
+    # Levels from level() must not be used after this
+    def close( self ):
+        if self.map is None:
+            return
+        self.index.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # Levels still hold views of the mapping. It is freed along with them
+            pass
+        self.map = None
+
+
+# Write a corpus of generated levels, or report on an existing one
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description="Save Maze Runner levels to a corpus file" )
+    parser.add_argument( "path", help="corpus file to write, or to read with --info" )
+    parser.add_argument( "--info", action="store_true", help="report on an existing corpus instead of writing one" )
+    parser.add_argument( "--count", type=int, default=1000, help="number of levels to write" )
+    parser.add_argument( "--width", type=int, default=61, help="map width in tiles. Other widths than 61 use the BSP generator" )
+    parser.add_argument( "--seed", type=int, default=None, help="seed for the sequence of levels" )
+    parser.add_argument( "--compression", choices=[ "rle", "zlib" ], default=None, help="compress the tiles" )
+    args = parser.parse_args()
+
+    maze.configure_logging( "INFO" )
+    start = time.perf_counter()
+    if args.info:
+        with Corpus( args.path ) as corpus:
+            tiles = 0
+            for level in corpus:
+                tiles += len( level.cells )
+            count = len( corpus )
+        elapsed = time.perf_counter() - start
+        maze.logger.info( "%d levels ( %d tiles ) read in %.3fs ( %.0f levels/sec )",
+                          count, tiles, elapsed, count / max( elapsed, 1e-9 ) )
+    else:
+        generator = None if args.width == 61 else maze.BSPGenerator()
+        board = maze.Board( args.width, generator )
+        seeds = random.Random( args.seed )
+        with CorpusWriter( args.path, args.compression ) as writer:
+            for _ in range( args.count ):
+                board.board_clear()
+                board.new_level( seed=seeds.getrandbits( 32 ) )
+                writer.add( board.snapshot() )
+        elapsed = time.perf_counter() - start
+        maze.logger.info( "%d levels written to %s in %.3fs", args.count, args.path, elapsed )
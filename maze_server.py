@@ -0,0 +1,317 @@
+import argparse
+import asyncio
+import random
+import signal
+import struct
+import time
+
+import Daniel_Krause_CSE_120_Final as maze
+from maze_farm import LevelFarm
+
+"""
+    Session Protocol
+
+    One connection is one session playing its own Board. The client sends actions as single bytes
+        ( the ACTION_* codes ) and may send several before reading any replies. The server answers
+        every action, in order, with one state message holding only what changed:
+
+        hello  : magic "MZSV", protocol version, map width          -> sent once, on connect
+        state  : flags, player x, player y, changed tile count
+        seed   : level seed                                         -> only when FLAG_LEVEL is set
+        tiles  : x, y, tile code for every changed tile
+
+    FLAG_LOCKED is set while the door is locked. FLAG_LEVEL means a new level was loaded, and the
+        client can rebuild its tiles from the seed with the server's generator. FLAG_COMPLETE means
+        the action finished the level. The first state message, right after hello, has FLAG_LEVEL set
+"""
+HELLO_MAGIC = b"MZSV"
+PROTOCOL_VERSION = 1
+
+HELLO = struct.Struct( "<4sBH" )
+STATE = struct.Struct( "<BHHH" )
+SEED = struct.Struct( "<Q" )
+TILE = struct.Struct( "<HHB" )
+
+FLAG_LOCKED = 1
+FLAG_LEVEL = 2
+FLAG_COMPLETE = 4
+
+class ProtocolError( ValueError ):
+    pass
+
+# Append the state message for board to out, and clear the board's changed tiles
+def pack_state( out, board, flags=0 ):
+    if board.door.locked:
+        flags |= FLAG_LOCKED
+    changed = board.changed_tiles
+    out += STATE.pack( flags, board.player.x, board.player.y, len( changed ) )
+    if flags & FLAG_LEVEL:
+        out += SEED.pack( board.seed )
+    cells = board.board.cells
+    height = board.board.height
+    for x, y in changed:
+        out += TILE.pack( x, y, cells[ x * height + y ] )
+    changed.clear()
+
+# Read one state message. Returns ( flags, x, y, seed or None, [ ( x, y, code ), ... ] )
+async def read_state( reader ):
+    flags, x, y, count = STATE.unpack( await reader.readexactly( STATE.size ) )
+    seed = None
+    if flags & FLAG_LEVEL:
+        seed, = SEED.unpack( await reader.readexactly( SEED.size ) )
+    tiles = list( TILE.iter_unpack( await reader.readexactly( count * TILE.size ) ) ) if count else []
+    return flags, x, y, seed, tiles
+
+# Read the hello message and return the map width
+async def read_hello( reader ):
+    magic, version, width = HELLO.unpack( await reader.readexactly( HELLO.size ) )
+    if magic != HELLO_MAGIC:
+        raise ProtocolError( "Not a Maze Runner session server" )
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError( f"Unsupported protocol version {version}" )
+    return width
+
+"""
+    Session Server
+
+    Runs every session in one asyncio event loop. Moves and interactions are applied straight to
+        the session's Board. New levels are built by a LevelFarm in worker processes, so the event
+        loop keeps serving other sessions while a level is generated. A session's own actions wait
+        until its new level is loaded, since they are handled in order
+"""
+class SessionServer:
+    def __init__(self, iwidth=61, igenerator=None, iseed=None, iprocesses=None):
+        self.width = iwidth
+        self.generator = maze.BlockGenerator() if igenerator is None else igenerator
+        self.farm = LevelFarm( iwidth, self.generator, iprocesses )
+        self.seeds = random.Random( iseed )
+        self.sessions = 0
+        self.peak_sessions = 0
+        self.actions = 0
+        self.levels = 0
+
+    def close( self ):
+        self.farm.close()
+
+    # Load a freshly generated level into board without blocking the event loop
+    async def new_level( self, board ):
+        future, shm = self.farm.submit( self.seeds.getrandbits( 32 ) )
+        try:
+            await asyncio.wrap_future( future )
+        except asyncio.CancelledError:
+            # The session went away. Free the block once the worker is done with it
+            future.add_done_callback( lambda done: self.discard( done, shm ) )
+            raise
+        level = self.farm.collect( future, shm )
+        try:
+            board.load_level( level )
+        finally:
+            level.close()
+        self.levels += 1
+
+    def discard( self, future, shm ):
+        try:
+            self.farm.collect( future, shm ).close()
+        except BaseException:
+            pass
+
+    async def handle( self, reader, writer ):
+        self.sessions += 1
+        self.peak_sessions = max( self.peak_sessions, self.sessions )
+        board = maze.Board( self.width, self.generator )
+        moves = [ maze.MOVES.get( action ) for action in range( maze.ACTION_ZOOM_OUT + 1 ) ]
+        try:
+            await self.new_level( board )
+            out = bytearray( HELLO.pack( HELLO_MAGIC, PROTOCOL_VERSION, self.width ) )
+            pack_state( out, board, FLAG_LEVEL )
+            writer.write( out )
+
+            while True:
+                data = await reader.read( 4096 )
+                if not data:
+                    break
+                out = bytearray()
+                for action in data:
+                    if action >= len( moves ):
+                        raise ProtocolError( f"Unknown action {action}" )
+                    flags = 0
+                    delta = moves[ action ]
+                    if delta is not None:
+                        board.move( delta[0], delta[1] )
+                    elif action == maze.ACTION_INTERACT:
+                        if board.player_interaction():
+                            await self.new_level( board )
+                            flags = FLAG_LEVEL | FLAG_COMPLETE
+                    elif action == maze.ACTION_NEW_LEVEL:
+                        await self.new_level( board )
+                        flags = FLAG_LEVEL
+                    pack_state( out, board, flags )
+                self.actions += len( data )
+                writer.write( out )
+                await writer.drain()
+        except ProtocolError as error:
+            maze.logger.warning( "Closing a session: %s", error )
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def serve( self, host="127.0.0.1", port=7061, path=None ):
+        # Build one level before any session connects, which starts the workers. Forked workers
+        #   would otherwise keep copies of open sockets, and a closed session would never see the
+        #   end of its stream
+        future, shm = self.farm.submit( self.seeds.getrandbits( 32 ) )
+        await asyncio.wrap_future( future )
+        self.farm.collect( future, shm ).close()
+        if path is not None:
+            server = await asyncio.start_unix_server( self.handle, path, backlog=4096 )
+        else:
+            server = await asyncio.start_server( self.handle, host, port, backlog=4096 )
+        maze.logger.info( "Serving %d tile sessions on %s", self.width, path or f"{host}:{port}" )
+        # Stop serving cleanly on Ctrl+C or kill, where the platform allows it
+        loop = asyncio.get_running_loop()
+        for number in ( signal.SIGINT, signal.SIGTERM ):
+            try:
+                loop.add_signal_handler( number, server.close )
+            except ( NotImplementedError, RuntimeError ):
+                pass
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+"""
+    Load Generator
+
+    Opens sessions connections, waits until every session has its first level, then has each one
+        send actions one at a time and time how long the reply takes. Every level_every-th action is
+        ACTION_NEW_LEVEL, so level generation is part of the load. Latencies of actions that loaded
+        a level are reported apart from the rest
+"""
+async def run_session( connect, actions, ready, start, latencies, level_latencies ):
+    reader, writer = await connect()
+    try:
+        await read_hello( reader )
+        await read_state( reader )
+        ready()
+        await start.wait()
+        for action in actions:
+            sent = time.perf_counter()
+            writer.write( bytes( ( action, ) ) )
+            flags = ( await read_state( reader ) )[0]
+            elapsed = time.perf_counter() - sent
+            ( level_latencies if flags & FLAG_LEVEL else latencies ).append( elapsed )
+    finally:
+        writer.close()
+
+async def run_load( sessions, count, host="127.0.0.1", port=7061, path=None, seed=None, level_every=50, connecting=256 ):
+    limit = asyncio.Semaphore( connecting )
+    async def connect():
+        async with limit:
+            if path is not None:
+                return await asyncio.open_unix_connection( path )
+            return await asyncio.open_connection( host, port )
+
+    start = asyncio.Event()
+    connected = 0
+    def ready():
+        nonlocal connected
+        connected += 1
+        if connected == sessions:
+            start.set()
+
+    seeds = random.Random( seed )
+    latencies = []
+    level_latencies = []
+    tasks = []
+    for _ in range( sessions ):
+        actions = bytearray( maze.random_actions( count, seeds.getrandbits( 32 ) ) )
+        if level_every:
+            actions[ level_every - 1 : : level_every ] = bytes( ( maze.ACTION_NEW_LEVEL, ) ) * len( actions[ level_every - 1 : : level_every ] )
+        tasks.append( asyncio.ensure_future( run_session( connect, actions, ready, start, latencies, level_latencies ) ) )
+
+    setup = time.perf_counter()
+    ready_task = asyncio.ensure_future( start.wait() )
+    await asyncio.wait( tasks + [ ready_task ], return_when=asyncio.FIRST_COMPLETED )
+    if not start.is_set():
+        # A session failed before the load started
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather( *tasks, return_exceptions=True )
+        ready_task.cancel()
+        raise next( task.exception() for task in tasks if task.done() and not task.cancelled() and task.exception() )
+    began = time.perf_counter()
+    await asyncio.gather( *tasks )
+    elapsed = time.perf_counter() - began
+    return {
+        "sessions": sessions,
+        "actions": len( latencies ) + len( level_latencies ),
+        "connect_seconds": began - setup,
+        "seconds": elapsed,
+        "actions_per_sec": ( len( latencies ) + len( level_latencies ) ) / max( elapsed, 1e-9 ),
+        "latency": latency_stats( latencies ),
+        "level_latency": latency_stats( level_latencies ),
+    }
+
+def latency_stats( samples ):
+    if not samples:
+        return None
+    ordered = sorted( samples )
+    return {
+        "count": len( ordered ),
+        "mean": sum( ordered ) / len( ordered ),
+        "p50": maze.percentile( ordered, 50 ),
+        "p90": maze.percentile( ordered, 90 ),
+        "p99": maze.percentile( ordered, 99 ),
+        "max": ordered[-1],
+    }
+
+# Thousands of sessions need thousands of open sockets, so raise the open file limit as far as allowed
+def raise_file_limit():
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit( resource.RLIMIT_NOFILE )
+    if soft != hard:
+        resource.setrlimit( resource.RLIMIT_NOFILE, ( hard, hard ) )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description="Serve many Maze Runner sessions from one process, or put load on a server" )
+    parser.add_argument( "mode", choices=[ "serve", "load" ], help="run the server, or the load generator" )
+    parser.add_argument( "--host", default="127.0.0.1", help="TCP address to serve on or connect to" )
+    parser.add_argument( "--port", type=int, default=7061, help="TCP port to serve on or connect to" )
+    parser.add_argument( "--unix", default=None, metavar="PATH", help="use a Unix socket at PATH instead of TCP" )
+    parser.add_argument( "--width", type=int, default=61, help="map width in tiles. Other widths than 61 use the BSP generator" )
+    parser.add_argument( "--seed", type=int, default=None, help="seed for the server's levels, or the load generator's actions" )
+    parser.add_argument( "--processes", type=int, default=None, help="level generation processes ( default: one per core )" )
+    parser.add_argument( "--sessions", type=int, default=1000, help="load: number of concurrent sessions" )
+    parser.add_argument( "--actions", type=int, default=200, help="load: actions sent by each session" )
+    parser.add_argument( "--level-every", type=int, default=50, help="load: ask for a new level every N actions ( 0 to never )" )
+    parser.add_argument( "--log-level", default="INFO", choices=[ "DEBUG", "INFO", "WARNING", "ERROR" ] )
+    args = parser.parse_args()
+
+    maze.configure_logging( args.log_level )
+    raise_file_limit()
+    if args.mode == "serve":
+        server = SessionServer( args.width, None if args.width == 61 else maze.BSPGenerator(), args.seed, args.processes )
+        try:
+            asyncio.run( server.serve( args.host, args.port, args.unix ) )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            maze.logger.info( "Served %d actions and %d levels, at most %d sessions at once",
+                              server.actions, server.levels, server.peak_sessions )
+    else:
+        result = asyncio.run( run_load( args.sessions, args.actions, args.host, args.port, args.unix, args.seed, args.level_every ) )
+        maze.logger.info( "%d sessions connected in %.2fs, then sent %d actions in %.2fs ( %.0f actions/sec )",
+                          result["sessions"], result["connect_seconds"], result["actions"], result["seconds"], result["actions_per_sec"] )
+        for name in ( "latency", "level_latency" ):
+            stats = result[ name ]
+            if stats is not None:
+                maze.logger.info( "%-14s %7d replies  p50 %8.3f ms  p90 %8.3f ms  p99 %8.3f ms  max %8.3f ms", name, stats["count"],
+                                  stats["p50"] * 1e3, stats["p90"] * 1e3, stats["p99"] * 1e3, stats["max"] * 1e3 )
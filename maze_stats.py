@@ -0,0 +1,276 @@
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import Daniel_Krause_CSE_120_Final as maze
+
+"""
+    Level Metrics
+
+    Measures one level on a Board:
+
+        floor_ratio       -> share of the map that can be walked on
+        rooms, tunnels    -> number of rooms and of room graph edges
+        room_overlap      -> share of room tiles that belong to more than one room
+        tunnel_tiles      -> floor tiles outside every room
+        start_key         -> steps from the player's start to the key
+        key_door          -> steps from the key to the door
+        door_start        -> steps from the door back to the start
+        route             -> start_key + key_door, the shortest way to finish the level
+        key_door_manhattan-> straight line ( Manhattan ) distance between the key and the door
+        dead_ends         -> floor tiles with only one floor neighbor
+        components        -> separate groups of connected floor tiles
+        connected         -> True if every floor tile can be reached from the start
+
+    Path lengths are -1 when there is no path. Two breadth first searches ( from the door and from
+        the key ) give all three path lengths, since paths are the same length both ways
+"""
+FIELDS = (
+    "seed", "width", "floor_ratio", "rooms", "tunnels", "room_overlap", "tunnel_tiles",
+    "start_key", "key_door", "door_start", "route", "key_door_manhattan", "dead_ends", "components", "connected",
+)
+
+def measure( board ):
+    grid = board.board
+    width = grid.width
+    height = grid.height
+    cells = grid.cells
+    paths = maze.PathFinder( board )
+    door_field = paths.field( board.door.x, board.door.y )
+    key_field = paths.field( board.key.x, board.key.y )
+    start = board.player.x * height + board.player.y
+    key = board.key.x * height + board.key.y
+
+    numpy = maze.load_numpy()
+    if numpy is not None:
+        tiles = grid.array
+        floor = tiles != maze.TILE_WALL
+        floor_tiles = int( floor.sum() )
+
+        cover = numpy.zeros( ( width, height ), dtype=numpy.int16 )
+        for room in board.rooms:
+            cover[ room.x : room.x + room.w, room.y : room.y + room.h ] += 1
+        room_tiles = int( cover.sum() )
+        overlap_tiles = int( ( cover[ cover > 1 ] ).sum() )
+        tunnel_tiles = int( ( floor & ( cover == 0 ) ).sum() )
+
+        padded = numpy.zeros( ( width + 2, height + 2 ), dtype=numpy.int8 )
+        padded[ 1 : -1, 1 : -1 ] = floor
+        neighbors = padded[ : -2, 1 : -1 ] + padded[ 2 :, 1 : -1 ] + padded[ 1 : -1, : -2 ] + padded[ 1 : -1, 2 : ]
+        dead_ends = int( ( floor & ( neighbors == 1 ) ).sum() )
+
+        reached = numpy.asarray( door_field ) >= 0
+        reachable = int( reached.sum() )
+        unreached = numpy.flatnonzero( floor.ravel() & ~reached )
+    else:
+        floor_tiles = len( cells ) - cells.count( maze.TILE_WALL )
+
+        cover = bytearray( width * height )
+        for room in board.rooms:
+            for x in range( room.x, room.x + room.w ):
+                for i in range( x * height + room.y, x * height + room.y + room.h ):
+                    cover[ i ] = min( cover[ i ] + 1, 255 )
+        room_tiles = sum( cover )
+        overlap_tiles = sum( count for count in cover if count > 1 )
+        tunnel_tiles = sum( 1 for i in range( len( cells ) ) if cells[ i ] and not cover[ i ] )
+
+        dead_ends = 0
+        for i in range( len( cells ) ):
+            if not cells[ i ]:
+                continue
+            y = i % height
+            count = ( y > 0 and cells[ i - 1 ] != 0 ) + ( y < height - 1 and cells[ i + 1 ] != 0 )
+            count += ( i >= height and cells[ i - height ] != 0 ) + ( i + height < len( cells ) and cells[ i + height ] != 0 )
+            if count == 1:
+                dead_ends += 1
+
+        reachable = sum( 1 for d in door_field if d >= 0 )
+        unreached = [ i for i in range( len( cells ) ) if cells[ i ] and door_field[ i ] < 0 ]
+
+    # Count the other groups of floor tiles, if there are any
+    components = 1 if floor_tiles else 0
+    if len( unreached ):
+        seen = set()
+        for i in unreached:
+            i = int( i )
+            if i in seen:
+                continue
+            components += 1
+            field = maze.PathFinder.expand_queue( grid, i )
+            seen.update( j for j in unreached if field[ int( j ) ] >= 0 )
+
+    start_key = int( key_field[ start ] )
+    key_door = int( door_field[ key ] )
+    door_start = int( door_field[ start ] )
+    return {
+        "seed": board.seed,
+        "width": width,
+        "floor_ratio": floor_tiles / ( width * height ),
+        "rooms": len( board.rooms ),
+        "tunnels": len( board.graph.edges ),
+        "room_overlap": overlap_tiles / room_tiles if room_tiles else 0.0,
+        "tunnel_tiles": tunnel_tiles,
+        "start_key": start_key,
+        "key_door": key_door,
+        "door_start": door_start,
+        "route": start_key + key_door if start_key >= 0 and key_door >= 0 else -1,
+        "key_door_manhattan": abs( board.key.x - board.door.x ) + abs( board.key.y - board.door.y ),
+        "dead_ends": dead_ends,
+        "components": components,
+        "connected": bool( reachable == floor_tiles and door_field[ start ] >= 0 ),
+    }
+
+"""
+    Workers
+
+    Each job measures a run of levels and sends back only the metrics. Generated levels are built
+        in the worker from their seeds, and saved levels are read by the worker straight from the
+        memory-mapped corpus, so no tiles cross between processes
+"""
+def measure_seeds( width, generator, seeds ):
+    board = maze.Board( width, generator )
+    rows = []
+    for seed in seeds:
+        board.board_clear()
+        board.new_level( seed=seed )
+        rows.append( measure( board ) )
+    return rows
+
+def measure_corpus( path, first, last ):
+    import maze_save
+    rows = []
+    with maze_save.Corpus( path ) as corpus:
+        board = None
+        for n in range( first, last ):
+            level = corpus.level( n )
+            if board is None or board.width != level.width:
+                board = maze.Board( level.width )
+            board.load_level( level )
+            rows.append( measure( board ) )
+            del level
+    return rows
+
+# Yield metric rows for every job, in order, keeping at most pending jobs in flight
+def run_jobs( pool, jobs, pending ):
+    futures = []
+    jobs = iter( jobs )
+    for job in jobs:
+        futures.append( pool.submit( *job ) )
+        if len( futures ) >= pending:
+            break
+    while futures:
+        rows = futures.pop( 0 ).result()
+        job = next( jobs, None )
+        if job is not None:
+            futures.append( pool.submit( *job ) )
+        yield from rows
+
+"""
+    Summary
+
+    Count, mean, standard deviation, minimum, percentiles and maximum of every numeric metric.
+        Unreachable path lengths ( -1 ) are counted separately instead of being averaged in
+"""
+class Summary:
+    PATHS = ( "start_key", "key_door", "door_start", "route" )
+
+    def __init__(self):
+        self.values = { name: [] for name in FIELDS if name not in ( "seed", "width", "connected" ) }
+        self.count = 0
+        self.disconnected = 0
+        self.unreachable = 0
+
+    def add( self, row ):
+        self.count += 1
+        self.disconnected += not row["connected"]
+        self.unreachable += row["route"] < 0
+        for name, values in self.values.items():
+            if name in self.PATHS and row[ name ] < 0:
+                continue
+            values.append( row[ name ] )
+
+    def report( self ):
+        stats = { "levels": self.count, "disconnected": self.disconnected, "unsolvable": self.unreachable, "metrics": {} }
+        for name, values in self.values.items():
+            if not values:
+                continue
+            values.sort()
+            mean = sum( values ) / len( values )
+            stats["metrics"][ name ] = {
+                "mean": mean,
+                "std": math.sqrt( sum( ( v - mean ) ** 2 for v in values ) / len( values ) ),
+                "min": values[0], "p10": maze.percentile( values, 10 ), "p50": maze.percentile( values, 50 ), "p90": maze.percentile( values, 90 ), "max": values[-1],
+            }
+        return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser( description="Measure the quality of Maze Runner levels" )
+    parser.add_argument( "--count", type=int, default=10000, help="number of levels to generate" )
+    parser.add_argument( "--width", type=int, default=61, help="map width in tiles" )
+    parser.add_argument( "--seed", type=int, default=None, help="seed for the sequence of levels" )
+    parser.add_argument( "--generator", choices=[ "block", "bsp" ], default=None,
+                         help="level generator ( default: block for 61 tile maps, bsp otherwise )" )
+    parser.add_argument( "--connect", choices=maze.CONNECT_STRATEGIES, default="chain", help="how rooms are tunneled together" )
+    parser.add_argument( "--extra-loops", type=int, default=0, help="extra tunnels for the mst strategy" )
+    parser.add_argument( "--corpus", default=None, metavar="PATH", help="measure the levels in a maze_save corpus instead of generating" )
+    parser.add_argument( "--output", default=None, metavar="PATH", help="write one row per level here ( default: standard output )" )
+    parser.add_argument( "--format", choices=[ "csv", "jsonl" ], default="csv", help="format of the per-level rows" )
+    parser.add_argument( "--summary", default=None, metavar="PATH", help="also write the summary to PATH as JSON" )
+    parser.add_argument( "--processes", type=int, default=None, help="worker processes ( default: one per core )" )
+    parser.add_argument( "--chunk", type=int, default=250, help="levels per job" )
+    args = parser.parse_args()
+
+    maze.configure_logging( "INFO" )
+    processes = args.processes or os.cpu_count() or 1
+
+    if args.corpus is not None:
+        import maze_save
+        with maze_save.Corpus( args.corpus ) as corpus:
+            total = len( corpus )
+        jobs = ( ( measure_corpus, args.corpus, first, min( first + args.chunk, total ) ) for first in range( 0, total, args.chunk ) )
+    else:
+        kind = args.generator or ( "block" if args.width == 61 else "bsp" )
+        if kind == "block":
+            generator = maze.BlockGenerator( iconnect=args.connect, iextra_loops=args.extra_loops )
+        else:
+            generator = maze.BSPGenerator( iconnect=args.connect, iextra_loops=args.extra_loops )
+        seeds = random.Random( args.seed )
+        total = args.count
+        jobs = (
+            ( measure_seeds, args.width, generator, [ seeds.getrandbits( 32 ) for _ in range( min( args.chunk, total - first ) ) ] )
+            for first in range( 0, total, args.chunk )
+        )
+
+    output = sys.stdout if args.output is None else open( args.output, "w", newline="" )
+    writer = csv.DictWriter( output, FIELDS ) if args.format == "csv" else None
+    if writer is not None:
+        writer.writeheader()
+    summary = Summary()
+    start = time.perf_counter()
+    with ProcessPoolExecutor( processes ) as pool:
+        for row in run_jobs( pool, jobs, 2 * processes ):
+            summary.add( row )
+            if writer is not None:
+                writer.writerow( row )
+            else:
+                output.write( json.dumps( row ) + "\n" )
+    elapsed = time.perf_counter() - start
+    if output is not sys.stdout:
+        output.close()
+
+    report = summary.report()
+    maze.logger.info( "%d levels measured in %.2fs ( %.0f levels/sec ) on %d processes, %d disconnected, %d unsolvable",
+                      summary.count, elapsed, summary.count / max( elapsed, 1e-9 ), processes, summary.disconnected, summary.unreachable )
+    for name, stats in report["metrics"].items():
+        maze.logger.info( "%-20s mean %10.3f  std %9.3f  min %9.3f  p10 %9.3f  p50 %9.3f  p90 %9.3f  max %9.3f",
+                          name, stats["mean"], stats["std"], stats["min"], stats["p10"], stats["p50"], stats["p90"], stats["max"] )
+    if args.summary is not None:
+        with open( args.summary, "w" ) as file:
+            json.dump( report, file, indent=2 )